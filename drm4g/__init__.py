@@ -71,6 +71,7 @@ COMMUNICATORS = {
     "ssh_fabric"   : "drm4g.communicators.ssh_fabric",
     "pk_ssh"       : "drm4g.communicators.ssh",
     "op_ssh"       : "drm4g.communicators.openssh",
+    "op_ssh_session" : "drm4g.communicators.openssh_session",
     "local"        : "drm4g.communicators.local",
 }
 RESOURCE_MANAGERS = {
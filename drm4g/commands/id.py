@@ -75,7 +75,7 @@ def run( arg ) :
             raise Exception( "'%s' does not have an identity to configure." % ( arg['<resource_name>'] ) )
         if lrms == 'cream' or lrms == 'rocci' :
             comm = config.make_communicators()[ arg['<resource_name>'] ]
-            if communicator == 'op_ssh' :
+            if communicator in ( 'op_ssh', 'op_ssh_session' ) :
                 #paramiko will always be used to renew the grid certificate
                 config.resources.get( arg['<resource_name>'] )[ 'communicator' ] = 'pk_ssh'
                 comm = config.make_communicators()[ arg['<resource_name>'] ]
@@ -18,7 +18,11 @@
 # permissions and limitations under the Licence.
 #
 
+import re
+import uuid
+import asyncio
 import logging
+import threading
 from drm4g import DRM4G_DIR
 from os.path import join
 
@@ -48,6 +52,8 @@ class Communicator(object):
         self.frontend       = None
         self.private_key    = None
         self.public_key     = None
+        # Limit of simultaneous transfers with the resource
+        self._sem           = threading.Semaphore( SFTP_CONNECTIONS )
 
     def connect(self):
         """
@@ -68,6 +74,65 @@ class Communicator(object):
         """
         pass
 
+    def execBatch(self, commands):
+        """
+        Execute several commands with a single remote execution. Each command
+        runs in its own subshell, with stdin closed, and its output is
+        printed between marker lines that carry its exit status.
+
+        @param commands: shell commands to execute, one after another
+        @type commands: list
+        @return: (stdout, stderr, exit status) of each command, the status is
+            None if the command did not run
+        @rtype: list of tuples
+        """
+        if not commands :
+            return []
+        marker = 'DRM4G_BATCH_%s' % uuid.uuid4().hex
+        script = [ 'drm4g_err=$(mktemp)' ]
+        for index, command in enumerate( commands ) :
+            script.append( "printf '\\n%s %d out\\n'; ( %s\n) < /dev/null 2> $drm4g_err; drm4g_status=$?; "
+                           "printf '\\n%s %d err\\n'; cat $drm4g_err; printf '\\n%s %d status %%d\\n' $drm4g_status" % (
+                           marker, index, command, marker, index, marker, index ) )
+        script.append( 'rm -f $drm4g_err' )
+        out, err = self.execCommand( '\n'.join( script ) )
+        if isinstance( out, bytes ) :
+            out, err = out.decode( 'utf-8', 'replace' ), err.decode( 'utf-8', 'replace' )
+        sections = dict()
+        matches  = list( re.finditer( r'^%s (\d+) (out|err|status)(?: (\d+))?$' % marker, out or '', re.M ) )
+        for match, following in zip( matches, matches[ 1: ] + [ None ] ) :
+            index, stream, status = int( match.group( 1 ) ), match.group( 2 ), match.group( 3 )
+            section = sections.setdefault( index, dict() )
+            if stream == 'status' :
+                section[ 'status' ] = int( status )
+            elif following is not None :
+                # the section ends at the line break printed before the next marker
+                section[ stream ] = out[ match.end() + 1 : following.start() - 1 ]
+        results = []
+        for index, command in enumerate( commands ) :
+            section = sections.get( index, dict() )
+            if 'status' in section :
+                results.append( ( section[ 'out' ], section[ 'err' ], section[ 'status' ] ) )
+            else :
+                results.append( ( section.get( 'out', '' ), err or "No output from '%s'" % command, None ) )
+        return results
+
+    async def execCommandAsync(self, command, input=None):
+        """
+        Coroutine executing command, to be awaited in an asyncio event loop
+        (see drm4g.utils.aio). Communicators without a native implementation
+        run execCommand in the default executor of the loop.
+
+        @param command: a shell command to execute.
+        @type command: string
+        @param input: optional input argument
+        @type input: string
+        @return: stdout and stderr associated with the command executed
+        @rtype: tuple of string (stdout, stderr)
+        """
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor( None, self.execCommand, command, input )
+
     def mkDirectory(self, destination_url):
         """
         Create a directory.
@@ -77,6 +142,17 @@ class Communicator(object):
         """
         pass
 
+    async def mkDirectoryAsync(self, destination_url):
+        """
+        Coroutine creating a directory, by default mkDirectory in the
+        default executor of the loop.
+
+        @param destination_url: url of the folder to create
+        @type destination_url: string
+        """
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor( None, self.mkDirectory, destination_url )
+
     def copy(self, source_url, destination_url, execution_mode = 'X'):
         """
         Copy a file from source_url to destination_url. If execution_mode = 'X' you
@@ -91,6 +167,26 @@ class Communicator(object):
         """
         pass
 
+    def copyFiles(self, transfers):
+        """
+        Copy several files with the resource, e.g. all the input files of
+        a job. Communicators able to reuse a single channel for all the
+        files should overload this method.
+
+        @param transfers: (source_url, destination_url, execution_mode) tuples
+        @type transfers: list
+        @return: the error of each transfer, None if it succeeded
+        @rtype: list
+        """
+        errors = []
+        for source_url, destination_url, execution_mode in transfers :
+            try :
+                self.copy( source_url, destination_url, execution_mode )
+                errors.append( None )
+            except Exception as err :
+                errors.append( str( err ) )
+        return errors
+
     def rmDirectory(self, destination_url):
         """
         Remove a directory.
@@ -100,6 +196,17 @@ class Communicator(object):
         """
         pass
 
+    async def rmDirectoryAsync(self, destination_url):
+        """
+        Coroutine removing a directory, by default rmDirectory in the
+        default executor of the loop.
+
+        @param destination_url: url of the folder to remove
+        @type destination_url: string
+        """
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor( None, self.rmDirectory, destination_url )
+
     def checkoutLock(self, destination_url):
         """
         Check if URL it's locked. 
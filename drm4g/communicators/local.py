@@ -26,6 +26,7 @@ import threading
 import drm4g.communicators
 from drm4g.communicators import ComException
 from drm4g.utils.url     import urlparse
+from drm4g.utils.aio     import run_process
 
 import logging
 logger  = logging.getLogger(__name__)
@@ -58,6 +59,13 @@ class Communicator(drm4g.communicators.Communicator):
             stdout, stderr = command_proc.communicate()
         return stdout.decode() , stderr.decode()
 
+    async def execCommandAsync(self, command, input=None):
+        stdout, stderr, _ = await run_process( command,
+                                               input = input.encode() if input else None,
+                                               env   = os.environ,
+                                               shell = True )
+        return stdout.decode() , stderr.decode()
+
     def mkDirectory(self, url):
         to_dir = self._set_dir(urlparse(url).path)
         out, err = self.execCommand("mkdir -p %s" % to_dir )
@@ -66,6 +74,14 @@ class Communicator(drm4g.communicators.Communicator):
             logger.error( output )
             raise ComException( output )
 
+    async def mkDirectoryAsync(self, url):
+        to_dir   = self._set_dir(urlparse(url).path)
+        out, err = await self.execCommandAsync("mkdir -p %s" % to_dir )
+        if err:
+            output = "Could not create %s directory: %s " % ( to_dir , ' '.join( err.split( '\n' ) ) )
+            logger.error( output )
+            raise ComException( output )
+
     def copy(self, source_url, destination_url, execution_mode):
         with self._lock:
             if 'file://' in source_url:
@@ -90,6 +106,14 @@ class Communicator(drm4g.communicators.Communicator):
             logger.error( output )
             raise ComException( output )
 
+    async def rmDirectoryAsync(self, url):
+        to_dir   = self._set_dir(urlparse(url).path)
+        out, err = await self.execCommandAsync("rm -rf %s" % to_dir )
+        if err:
+            output = "Could not remove %s directory: %s " % ( to_dir , ' '.join( err.split( '\n' ) ) )
+            logger.error( output )
+            raise ComException( output )
+
     def checkoutLock(self, url):
         to_dir = self._set_dir(urlparse(url).path)
         return os.path.isfile( '%s/.lock' % to_dir )
@@ -20,21 +20,24 @@
 
 import sys
 import os
-from os.path     import join, expanduser, exists, basename
+from os.path     import join, expanduser, exists, basename, dirname
 
 import io
 import re
+import asyncio
 import time
 import signal
 import traceback
+import tempfile
 import threading
 import subprocess
 import drm4g.communicators
 import drm4g.commands
 from drm4g.commands         import Agent
-from drm4g.communicators    import SSH_CONNECT_TIMEOUT, SFTP_CONNECTIONS
+from drm4g.communicators    import SSH_CONNECT_TIMEOUT
 from drm4g                  import DRM4G_DIR, DRM4G_DIR_VAR 
 from drm4g.utils.url        import urlparse
+from drm4g.utils.aio        import run_process
 from .openssh_wrapper import SSHConnection
 
 import logging
@@ -46,11 +49,15 @@ class Communicator(drm4g.communicators.Communicator):
     Create a SSH session to remote resources.
     """
     _lock       = threading.Lock()
-    _sem        = threading.Semaphore(SFTP_CONNECTIONS)
     _trans      = None
 
     socket_dir=None
 
+    # Master connections being started, one lock per socket
+    _masters_lock = threading.Lock()
+    _master_locks = dict()
+    master_timeout = 30 #seconds
+
     def __init__(self):
         super(Communicator,self).__init__()
         #logger.debug("\n\nCREATING NEW COMMUNICATOR\n%s\n" % traceback.format_exc())
@@ -141,44 +148,7 @@ class Communicator(drm4g.communicators.Communicator):
                 self.createConfFiles()
             logger.debug("The socket "+join(Communicator.socket_dir, '%s-%s@%s:%s' % (self.parent_module ,self.username, self.frontend, self.port))+" existance is "+str(exists(join(Communicator.socket_dir, '%s-%s@%s:%s' % (self.parent_module ,self.username, self.frontend, self.port)))))
 
-            if not exists(join(Communicator.socket_dir, '%s-%s@%s:%s' % (self.parent_module ,self.username, self.frontend, self.port))):
-                logger.debug("No master conncection exists for %s so a new one will be created" % self.parent_module)
-                def first_ssh():
-                    try:
-                        logger.debug("Running first_ssh function\n    - Creating first connection for %s" % self.parent_module)
-                        #this is here because the threads are created at the same time, so the moment one creates the conection, the rest are going to cause an UnboundLocalError exception
-                        #(which probably shouldn't be ocurring since ControlMaster is set to auto - only if they execute this at the same time)
-                        if not exists(join(Communicator.socket_dir, '%s-%s@%s:%s' % (self.parent_module ,self.username, self.frontend, self.port))):
-                            command = 'ssh -F %s -i %s -p %s -T %s@%s' % (self.configfile, self.private_key, str(self.port), self.username, self.frontend)
-                        pipe = subprocess.Popen(command.split(), stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-                        out,err = pipe.communicate()
-
-                        if err:
-                            if "too long for Unix domain socket" in str(err) or "ControlPath too long" in str(err):
-                                logger.debug("Socket path was too long for Unix domain socket.\n    Creating sockets in ~/.ssh/dmr4g.\n    Exception captured in first_ssh.")
-                                self._change_socket_dir()
-                                logger.debug("Calling first_ssh once again, but with a new socket_dir")
-                                first_ssh()
-                            elif "disabling multiplexing" in str(err):
-                                logger.debug("connect function: The multiplexing of connections isn't working. Eliminating "+self.parent_module+"'s socket file.")
-                                self._delete_socket()
-                                first_ssh()
-                            elif "bind: No such file or directory" in str(err) or "cannot bind to path" in str(err):
-                                logger.debug("The connection through the socket %s-%s@%s:%s wasn't established since the socket directory %s hasn't been created yet." % (self.parent_module ,self.username, self.frontend, self.port, Communicator.socket_dir))
-                                self.createConfFiles()
-                                first_ssh()
-                            else:
-                                logger.debug("Unexpected error occured while running first_ssh:\n"+str(err))
-                                logger.warning(str(err))
-                    except UnboundLocalError as err:
-                        logger.warning( "Local variable referenced before assignment" )
-                        logger.debug( str(err) )
-
-                t = threading.Thread(target=first_ssh, args = ())
-                t.daemon = True
-                logger.debug("Starting thread with first_ssh")
-                t.start()
-                time.sleep(5) #so that there's time to make the first connection in case there was an error
+            self._start_master()
 
             if self.conn==None:
                 logger.debug("No conn exists (conn == "+str(self.conn)+") for "+self.parent_module+" so a new one will be created.")
@@ -197,6 +167,68 @@ class Communicator(drm4g.communicators.Communicator):
                 logger.error(str(excep))
                 raise
 
+    def _socket_path(self):
+        return join(Communicator.socket_dir, '%s-%s@%s:%s' % (self.parent_module ,self.username, self.frontend, self.port))
+
+    def _master_alive(self):
+        """
+        Ask the master connection whether it is running with `ssh -O check`.
+        """
+        command = ['ssh', '-F', self.configfile, '-p', str(self.port), '-O', 'check', '%s@%s' % (self.username, self.frontend)]
+        with open(os.devnull, 'w') as devnull:
+            return subprocess.call(command, stdin=devnull, stdout=devnull, stderr=devnull, env=self.get_env()) == 0
+
+    def _start_master(self, retry=True):
+        """
+        Start the master connection of the socket in the background with
+        `ssh -M -N -f` and wait, up to master_timeout seconds, until
+        `ssh -O check` reports it ready. Bootstraps of the same socket are
+        serialised, so concurrent threads share a single master.
+        """
+        socket_path = self._socket_path()
+        with Communicator._masters_lock:
+            master_lock = Communicator._master_locks.setdefault(socket_path, threading.Lock())
+        with master_lock:
+            if exists(socket_path):
+                if self._master_alive():
+                    return
+                logger.debug("Removing the stale socket %s" % socket_path)
+                self._delete_socket()
+            logger.debug("No master connection exists for %s so a new one will be created" % self.parent_module)
+            command = ['ssh', '-F', self.configfile, '-i', self.private_key, '-p', str(self.port),
+                       '-M', '-N', '-f', '%s@%s' % (self.username, self.frontend)]
+            # The background master keeps the pipes open, so stderr goes to a file
+            with tempfile.TemporaryFile() as stderr, open(os.devnull, 'w') as devnull:
+                pipe = subprocess.Popen(command, stdin=devnull, stdout=devnull, stderr=stderr, env=self.get_env())
+                deadline = time.time() + self.master_timeout
+                while pipe.poll() is None and time.time() < deadline:
+                    time.sleep(0.1)
+                if pipe.poll() is None:
+                    pipe.kill()
+                stderr.seek(0)
+                err = stderr.read().decode('utf-8', 'replace')
+            if "too long for Unix domain socket" in err or "ControlPath too long" in err:
+                logger.debug("Socket path was too long for Unix domain socket.\n    Creating sockets in ~/.ssh/drm4g.")
+                self._change_socket_dir()
+            elif "bind: No such file or directory" in err or "cannot bind to path" in err:
+                logger.debug("The socket directory %s hasn't been created yet." % Communicator.socket_dir)
+                self.createConfFiles()
+            elif "disabling multiplexing" in err:
+                logger.debug("The multiplexing of connections isn't working. Eliminating %s's socket file." % self.parent_module)
+                self._delete_socket()
+            elif pipe.returncode:
+                raise Exception("Could not start the master connection to '%s': %s" % (self.frontend, err.strip()))
+            else:
+                while time.time() < deadline:
+                    if exists(socket_path) and self._master_alive():
+                        logger.debug("Master connection for %s is ready" % self.parent_module)
+                        return
+                    time.sleep(0.1)
+                raise Exception("Timeout starting the master connection to '%s': %s" % (self.frontend, err.strip()))
+        if not retry:
+            raise Exception("Could not start the master connection to '%s': %s" % (self.frontend, err.strip()))
+        self._start_master(retry=False)
+
     def execCommand(self , command , input = None ):
         try:
             logger.debug("Running execCommand function from "+self.parent_module+"\n    - Trying to execute command "+str(command))
@@ -216,6 +248,25 @@ class Communicator(drm4g.communicators.Communicator):
             else:
                 logger.warning(str(excep))
 
+    async def execCommandAsync(self , command , input = None ):
+        """
+        Run command with an ssh process through the master connection,
+        waiting for it in the event loop instead of in a thread.
+        """
+        if not self.conn:
+            await asyncio.get_event_loop().run_in_executor( None, self.connect )
+        ssh_command = self.conn.ssh_command( '/bin/bash', False )
+        try:
+            out, err, returncode = await run_process( ssh_command, input = command.encode( 'utf-8' ),
+                                                      timeout = self.conn.timeout, env = self.get_env() )
+        except asyncio.TimeoutError:
+            raise drm4g.communicators.ComException( "Timeout running '%s' in '%s'" % ( command, self.frontend ) )
+        if returncode == 255:  # ssh client error
+            if b"disabling multiplexing" in err:
+                self._delete_socket()
+            raise drm4g.communicators.ComException( err.strip().decode( 'utf-8', 'replace' ) )
+        return out.strip() , err.strip()
+
     def mkDirectory(self, url):
         try:
             logger.debug("Running mkDirectory function from %s" % self.parent_module)
@@ -248,6 +299,24 @@ class Communicator(drm4g.communicators.Communicator):
             else:
                 logger.warning(str(excep))
 
+    async def mkDirectoryAsync(self, url):
+        to_dir = self._set_dir(urlparse(url).path)
+        try:
+            stdout, stderr = await self.execCommandAsync( "mkdir -p %s" % to_dir )
+            if stderr :
+                logger.warning( "Could not create %s directory: %s" % ( to_dir , stderr.decode( 'utf-8', 'replace' ) ) )
+        except Exception as excep:
+            logger.warning(str(excep))
+
+    async def rmDirectoryAsync(self, url):
+        to_dir = self._set_dir(urlparse(url).path)
+        try:
+            stdout, stderr = await self.execCommandAsync( "rm -rf %s" % to_dir )
+            if stderr :
+                logger.warning( "Could not remove %s directory: %s" % ( to_dir , stderr.decode( 'utf-8', 'replace' ) ) )
+        except Exception as excep:
+            logger.warning(str(excep))
+
     def copy( self , source_url , destination_url , execution_mode = '' ) :
         try:
             logger.debug("Running copy function from %s" % self.parent_module)
@@ -275,6 +344,39 @@ class Communicator(drm4g.communicators.Communicator):
             else:
                 logger.warning(str(excep))
 
+    def copyFiles( self , transfers ) :
+        """
+        Upload the files going to the same remote directory with a single
+        scp command. The rest of transfers, and the files of a failed
+        upload, are copied one by one.
+        """
+        errors  = [ None ] * len( transfers )
+        uploads = dict()
+        for index, ( source_url, destination_url, execution_mode ) in enumerate( transfers ) :
+            from_dir = urlparse( source_url ).path
+            to_dir   = self._set_dir( urlparse( destination_url ).path )
+            if 'file://' in source_url and basename( from_dir ) == basename( to_dir ) :
+                uploads.setdefault( dirname( to_dir ), [] ).append( ( index, from_dir, to_dir, execution_mode ) )
+            else :
+                errors[ index ] = drm4g.communicators.Communicator.copyFiles( self, [ transfers[ index ] ] )[ 0 ]
+        for target, files in list( uploads.items() ) :
+            try :
+                if not self.conn:
+                    self.connect()
+                with self._sem :
+                    self.conn.scp( [ from_dir for _, from_dir, _, _ in files ] , target=target )
+            except Exception as excep :
+                logger.debug( "Could not upload %d files to %s at once: %s" % ( len( files ), target, str( excep ) ) )
+                for index, _, _, _ in files :
+                    errors[ index ] = drm4g.communicators.Communicator.copyFiles( self, [ transfers[ index ] ] )[ 0 ]
+                continue
+            executable = [ to_dir for _, _, to_dir, execution_mode in files if execution_mode == 'X' ]
+            if executable :
+                stdout, stderr = self.execCommand( "chmod +x %s" % ' '.join( executable ) )
+                if stderr :
+                    logger.warning( "Could not change access permissions of %s files: %s" % ( ' '.join( executable ) , stderr ) )
+        return errors
+
     def _change_socket_dir(self):
         logger.debug("Running _change_socket_dir function from %s" % self.parent_module)
         try:
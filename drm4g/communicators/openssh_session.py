@@ -0,0 +1,240 @@
+#
+# Copyright 2021 Santander Meteorology Group (UC-CSIC)
+#
+# Licensed under the EUPL, Version 1.1 only (the
+# "Licence");
+# You may not use this work except in compliance with the
+# Licence.
+# You may obtain a copy of the Licence at:
+#
+# http://ec.europa.eu/idabc/eupl
+#
+# Unless required by applicable law or agreed to in
+# writing, software distributed under the Licence is
+# distributed on an "AS IS" basis,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either
+# express or implied.
+# See the Licence for the specific language governing
+# permissions and limitations under the Licence.
+#
+
+import os
+import time
+import uuid
+import select
+import logging
+import threading
+import subprocess
+
+from drm4g.communicators         import ComException, SSH_CONNECT_TIMEOUT
+from drm4g.communicators.openssh import Communicator as OpenSSHCommunicator
+
+logger  = logging.getLogger(__name__)
+
+
+class ShellSession(object):
+    """
+    Long-lived shell reading framed commands from its standard input.
+
+    Every command runs in a subshell followed by a random marker on stdout,
+    carrying its exit code, and on stderr, so the output of each request
+    is demultiplexed from the pipes of the session.
+    """
+    def __init__(self, command, env=None):
+        self._proc = subprocess.Popen( command,
+                                       stdin  = subprocess.PIPE,
+                                       stdout = subprocess.PIPE,
+                                       stderr = subprocess.PIPE,
+                                       env    = env )
+
+    def is_alive(self):
+        return self._proc.poll() is None
+
+    def run(self, command, timeout=SSH_CONNECT_TIMEOUT):
+        """
+        Execute command in the session.
+
+        @param command: a shell command to execute
+        @type command: string
+        @param timeout: seconds to wait for the command
+        @type timeout: int
+        @return: stdout, stderr and exit code of the command
+        @rtype: tuple (string, string, int)
+        """
+        out, err, status = self.run_batch( [ command ], timeout )[ 0 ]
+        return out.strip( ), err.strip( ), status
+
+    def run_batch(self, commands, timeout=SSH_CONNECT_TIMEOUT):
+        """
+        Write several commands to the session at once and read back their
+        results, as execBatch of the communicators.
+
+        @param commands: shell commands to execute, one after another
+        @type commands: list
+        @param timeout: seconds to wait for all the commands
+        @type timeout: int
+        @return: (stdout, stderr, exit code) of each command
+        @rtype: list of tuples
+        """
+        markers = [ 'DRM4G_%s' % uuid.uuid4().hex for _ in commands ]
+        script  = ''.join( ( "(\n%s\n) < /dev/null\n"
+                             "printf '\\n%s %%d\\n' $?\n"
+                             "printf '\\n%s\\n' >&2\n" ) % ( command, marker, marker )
+                           for command, marker in zip( commands, markers ) ).encode( 'utf-8' )
+        stdin    = self._proc.stdin.fileno( )
+        stdout   = self._proc.stdout.fileno( )
+        stderr   = self._proc.stderr.fileno( )
+        streams  = { stdout : b'', stderr : b'' }
+        last_out = ( '\n%s ' % markers[ -1 ] ).encode( )
+        last_err = ( '\n%s\n' % markers[ -1 ] ).encode( )
+        pending  = set( streams )
+        deadline = time.time( ) + timeout
+        while pending :
+            remaining = deadline - time.time( )
+            if remaining <= 0 :
+                self.close( )
+                raise ComException( "Timeout running '%s' in the remote shell session" % '; '.join( commands ) )
+            # The script is written while reading, so a full pipe never blocks the shell
+            readable, writable, _ = select.select( list( pending ), [ stdin ] if script else [], [], remaining )
+            try :
+                if writable :
+                    script = script[ os.write( stdin, script ) : ]
+            except OSError as err :
+                self.close( )
+                raise ComException( "The remote shell session is closed: %s" % str( err ) )
+            for fd in readable :
+                data = os.read( fd, 65536 )
+                if not data :
+                    self.close( )
+                    raise ComException( "The remote shell session was closed running '%s'" % '; '.join( commands ) )
+                streams[ fd ] += data
+                if fd == stdout :
+                    done = last_out in streams[ fd ] and streams[ fd ].endswith( b'\n' )
+                else :
+                    done = streams[ fd ].endswith( last_err )
+                if done :
+                    pending.discard( fd )
+        results = []
+        out, err = streams[ stdout ], streams[ stderr ]
+        for marker in markers :
+            # the sections end at the line break printed before the marker
+            command_out, out    = out.split( ( '\n%s ' % marker ).encode( ), 1 )
+            status, out         = out.split( b'\n', 1 )
+            command_err, err    = err.split( ( '\n%s\n' % marker ).encode( ), 1 )
+            results.append( ( command_out.decode( 'utf-8', 'replace' ), command_err.decode( 'utf-8', 'replace' ), int( status ) ) )
+        return results
+
+    def close(self):
+        if self.is_alive( ) :
+            try :
+                self._proc.stdin.close( )
+                self._proc.wait( 1 )
+            except Exception :
+                self._proc.kill( )
+                self._proc.wait( )
+        for stream in ( self._proc.stdin, self._proc.stdout, self._proc.stderr ) :
+            try :
+                stream.close( )
+            except Exception :
+                pass
+
+
+class SessionPool(object):
+    """
+    Shell sessions to a host, each one running a single command at a time.
+
+    Idle sessions are reused and new ones are started, up to max_sessions,
+    when all of them are busy. Dead sessions are discarded.
+    """
+    def __init__(self, new_session, max_sessions):
+        self._new_session = new_session
+        self.max_sessions = max_sessions
+        self._cond        = threading.Condition()
+        self._idle        = []
+        self._busy        = 0
+
+    def lease(self):
+        with self._cond :
+            while True :
+                while self._idle :
+                    session = self._idle.pop( )
+                    if session.is_alive( ) :
+                        self._busy += 1
+                        return session
+                    logger.debug( "Discarding a closed remote shell session" )
+                    session.close( )
+                if self._busy < self.max_sessions :
+                    self._busy += 1
+                    break
+                if not self._cond.wait( SSH_CONNECT_TIMEOUT ) :
+                    raise ComException( "Timeout waiting for a free remote shell session" )
+        try :
+            return self._new_session( )
+        except Exception :
+            with self._cond :
+                self._busy -= 1
+                self._cond.notify( )
+            raise
+
+    def release(self, session):
+        with self._cond :
+            self._busy -= 1
+            if session.is_alive( ) :
+                self._idle.append( session )
+            self._cond.notify( )
+
+    def close(self):
+        with self._cond :
+            for session in self._idle :
+                session.close( )
+            self._idle = []
+            self._cond.notify_all( )
+
+
+class Communicator(OpenSSHCommunicator):
+    """
+    OpenSSH communicator running the commands in persistent remote shells.
+
+    The shells are opened through the master connection of the resource
+    and kept for the whole life of the communicator, so running a command
+    is a write to the pipe of an idle session instead of a new ssh process.
+    """
+    max_sessions = 4  # remote shells per communicator
+
+    def __init__(self):
+        super(Communicator, self).__init__()
+        self._sessions = SessionPool( self._new_session, self.max_sessions )
+
+    def _new_session(self):
+        if not self.conn :
+            self.connect( )
+        logger.debug( "Opening a remote shell session in '%s'" % self.frontend )
+        command = [ 'ssh', '-T', '-F', self.configfile, '-i', self.private_key, '-p', str( self.port ),
+                    '%s@%s' % ( self.username, self.frontend ), '/bin/bash' ]
+        return ShellSession( command, env = self.get_env( ) )
+
+    def execCommand(self, command, input=None):
+        if input :
+            return super(Communicator, self).execCommand( command, input )
+        session = self._sessions.lease( )
+        try :
+            out, err, _ = session.run( command )
+        finally :
+            self._sessions.release( session )
+        return out, err
+
+    def execBatch(self, commands):
+        """
+        Write all the commands to one session at once, which already
+        reports the exit status of each one.
+        """
+        if not commands :
+            return []
+        session = self._sessions.lease( )
+        try :
+            return session.run_batch( commands )
+        finally :
+            self._sessions.release( session )
+
+    def close(self):
+        self._sessions.close( )
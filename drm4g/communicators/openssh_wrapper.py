@@ -15,7 +15,6 @@ import re
 import os
 import sys
 import pipes
-import signal
 import shutil
 import getpass
 import tempfile
@@ -178,23 +177,22 @@ class SSHConnection(object):
         pipe = subprocess.Popen(ssh_command,
                 stdin=subprocess.PIPE, stdout=subprocess.PIPE,
                 stderr=subprocess.PIPE, env=self.get_env())
-        try:
-            signal.signal(signal.SIGALRM, _timeout_handler)
-        except ValueError:  # signal only works in main thread
-            pass
-        signal.alarm(self.timeout)
         out = b('')
         err = b('')
         try:
-            out, err = pipe.communicate(b(command))
+            # the deadline of communicate works in any thread, unlike SIGALRM
+            out, err = pipe.communicate(b(command), timeout=self.timeout)
+        except subprocess.TimeoutExpired:
+            pipe.kill()
+            pipe.communicate()
+            raise SSHError("%s (under %s): Timeout" % (
+                ' '.join(u_list(ssh_command)), self.user))
         except IOError as exc:
-            # pipe.terminate() # only in python 2.6 allowed
-            os.kill(pipe.pid, signal.SIGTERM)
-            signal.alarm(0)  # disable alarm
+            pipe.kill()
+            pipe.communicate()
             raise SSHError("%s (under %s): %s" % (
-                ' '.join(ssh_command), self.user, str(exc)))
+                ' '.join(u_list(ssh_command)), self.user, str(exc)))
 
-        signal.alarm(0)  # disable alarm
         returncode = pipe.returncode
         if returncode == 255:  # ssh client error
             raise SSHError("%s (under %s): %s" % (
@@ -236,22 +234,21 @@ class SSHConnection(object):
         pipe = subprocess.Popen(scp_command,
                 stdin=subprocess.PIPE, stdout=subprocess.PIPE,
                 stderr=subprocess.PIPE, env=self.get_env())
-        try:
-            signal.signal(signal.SIGALRM, _timeout_handler)
-        except ValueError:  # signal only works in main thread
-            pass
-        signal.alarm(self.timeout)
         err = b('')
         try:
-            _, err = pipe.communicate()
+            _, err = pipe.communicate(timeout=self.timeout)
+        except subprocess.TimeoutExpired:
+            pipe.kill()
+            pipe.communicate()
+            cleanup_tmp_dir()
+            raise SSHError("%s (under %s): Timeout" % (
+                ' '.join(u_list(scp_command)), self.user))
         except IOError as exc:
-            # pipe.terminate() # only in python 2.6 allowed
-            os.kill(pipe.pid, signal.SIGTERM)
-            signal.alarm(0)  # disable alarm
+            pipe.kill()
+            pipe.communicate()
             cleanup_tmp_dir()
             raise SSHError("%s (under %s): %s" % (
-                ' '.join(scp_command), self.user, str(exc)))
-        signal.alarm(0)  # disable alarm
+                ' '.join(u_list(scp_command)), self.user, str(exc)))
         returncode = pipe.returncode
         if returncode != 0:  # ssh client error
             cleanup_tmp_dir()
@@ -402,11 +399,6 @@ class SSHConnection(object):
         return env
 
 
-def _timeout_handler(signum, frame):
-    """ This function is called when ssh takes too long to connect. """
-    raise IOError('SSH connect timeout')
-
-
 class SSHResult(object):
     """
     Command execution status.
@@ -26,102 +26,219 @@ import threading
 from io                     import StringIO
 from os.path                import expanduser, exists
 
-from paramiko.transport     import Transport
-from paramiko.agent         import Agent
-from paramiko.dsskey        import DSSKey
-from paramiko.rsakey        import RSAKey
-from scp                    import SCPClient
-
 import drm4g.commands
 import drm4g.communicators
-from drm4g.communicators    import ComException, SSH_CONNECT_TIMEOUT, SFTP_CONNECTIONS
+from drm4g.communicators    import ComException, SSH_CONNECT_TIMEOUT
 from drm4g.utils.url        import urlparse
 
 logger  = logging.getLogger(__name__)
 
+class TransportPool(object):
+    """
+    Authenticated SSH transports to a host, shared by all the communicators
+    connecting with the same user, host, port and key.
+
+    Channels are leased on the transports up to max_sessions each (the
+    MaxSessions of the server) and new transports are opened, up to
+    max_transports, when all of them are busy. Broken transports are
+    discarded and replaced on the next lease.
+
+    The communicators using the pool are counted, and its transports are
+    closed once the last of them is closed.
+    """
+    def __init__(self, new_transport, max_transports, max_sessions):
+        self._new_transport = new_transport
+        self.max_transports = max_transports
+        self.max_sessions   = max_sessions
+        self._cond          = threading.Condition()
+        self._transports    = dict() # transport -> channels in use
+        self._opening       = 0
+        self._users         = 0
+
+    def lease(self):
+        """
+        Return a healthy transport with a free channel, waiting for one if
+        the pool is full.
+        """
+        with self._cond :
+            while True :
+                for transport, sessions in list( self._transports.items() ) :
+                    if not transport.is_active( ) or not transport.is_authenticated( ) :
+                        logger.debug( "Discarding broken SSH transport" )
+                        self._discard( transport )
+                    elif sessions < self.max_sessions :
+                        self._transports[ transport ] += 1
+                        return transport
+                if len( self._transports ) + self._opening < self.max_transports :
+                    self._opening += 1
+                    break
+                if not self._cond.wait( SSH_CONNECT_TIMEOUT ) :
+                    raise ComException( "Timeout waiting for a free SSH channel" )
+        try :
+            transport = self._new_transport( )
+        finally :
+            with self._cond :
+                self._opening -= 1
+                self._cond.notify_all( )
+        with self._cond :
+            self._transports[ transport ] = 1
+        return transport
+
+    def release(self, transport):
+        with self._cond :
+            if transport in self._transports :
+                self._transports[ transport ] -= 1
+                if not self._users and not self._transports[ transport ] :
+                    self._discard( transport )
+            self._cond.notify_all( )
+
+    def add_user(self):
+        with self._cond :
+            self._users += 1
+
+    def remove_user(self):
+        """
+        Drop a communicator from the pool. When none is left the idle
+        transports are closed, and the busy ones as soon as they are released.
+        """
+        with self._cond :
+            self._users = max( self._users - 1, 0 )
+            if not self._users :
+                for transport, sessions in list( self._transports.items() ) :
+                    if not sessions :
+                        self._discard( transport )
+            self._cond.notify_all( )
+
+    def discard(self, transport):
+        with self._cond :
+            self._discard( transport )
+            self._cond.notify_all( )
+
+    def close(self):
+        with self._cond :
+            for transport in list( self._transports.keys() ) :
+                self._discard( transport )
+            self._cond.notify_all( )
+
+    def _discard(self, transport):
+        self._transports.pop( transport, None )
+        try :
+            transport.close( )
+        except Exception :
+            pass
+
+
 class Communicator(drm4g.communicators.Communicator):
     """
     Create a SSH session to remote resources.
     """
-    _lock       = threading.Lock()
-    _sem        = threading.Semaphore(SFTP_CONNECTIONS)
-    _trans      = None
+    # Transport pools shared by the communicators of the process
+    _pools          = dict()
+    _pools_lock     = threading.Lock()
+    max_transports  = 2  # per (user, host, port, key)
+    max_sessions    = 8  # channels per transport, below the default MaxSessions (10)
+    _transport_pool = None # pool this communicator is counted in
+
+    def _pool(self):
+        key = ( self.username, self.frontend, self.port, self.private_key )
+        with Communicator._pools_lock :
+            pool = Communicator._pools.get( key )
+            if pool is None :
+                pool = Communicator._pools[ key ] = TransportPool( self._new_transport, self.max_transports, self.max_sessions )
+            if self._transport_pool is not pool :
+                if self._transport_pool is not None :
+                    self._transport_pool.remove_user( )
+                pool.add_user( )
+                self._transport_pool = pool
+            return pool
 
     def connect(self):
+        """
+        Make sure the pool of the host has an authenticated transport.
+        """
+        pool      = self._pool( )
+        transport = pool.lease( )
+        pool.release( transport )
+
+    def _new_transport(self):
+        from paramiko.transport import Transport
+        from paramiko.agent     import Agent
+        from paramiko.dsskey    import DSSKey
+        from paramiko.rsakey    import RSAKey
         try:
-            with self._lock :
-                if not self._trans or not self._trans.is_authenticated( ) :
-                    logger.debug("Opening ssh connection ... ")
-                    keys = None
-                    logger.debug("Trying ssh-agent ... " )
-                    drm4g_agent = drm4g.commands.Agent()
-                    drm4g_agent.start()
-                    drm4g_agent.update_agent_env()
-                    # paramiko agent
-                    agent = Agent()
-                    keys  = agent.get_keys()
-                    if not keys :
-                        logger.debug( "Error trying to connect to '%s'" % self.frontend )
-                        logger.debug( "Impossible to load '%s' key from the ssh-agent"  % self.private_key )
-                        try:
-                            status_ssh_agent = agent._conn
-                        except Exception as err :
-                            logger.warning( "Probably you are using paramiko version <= 1.7.7.2 : %s " % err )
-                            status_ssh_agent = agent._conn
-                        if not status_ssh_agent:
-                            logger.warning( "'ssh-agent' is not running" )
-                        else:
-                            if agent.get_keys():
-                                logger.warning( "ssh-agent is running but none of the keys have been accepted"
-                                "by remote frontend %s." % self.frontend )
-                            else:
-                                logger.debug( "'ssh-agent' is running but without any keys" )
-                    if self.private_key :
-                        logger.debug("Trying '%s' key ... " % self.private_key )
-                        private_key_path = expanduser( self.private_key )
-                        if ( not exists( private_key_path ) ) and ( not 'PRIVATE KEY' in  self.private_key ):
-                            output = "'%s'key does not exist" % private_key_path
-                            raise ComException( output )
-                        for pkey_class in (RSAKey, DSSKey):
-                            try :
-                                if 'PRIVATE KEY' in self.private_key : #TODO: Review this case
-                                    key  = pkey_class.from_private_key( StringIO.StringIO ( self.private_key.strip( "'" ) ) )
-                                else :
-                                    key  = pkey_class.from_private_key_file( private_key_path )
-                                keys = keys + (key,)
-                            except Exception :
-                                pass
-                    if not keys :
-                        output = "Impossible to load any keys"
-                        logger.error( output )
-                        raise ComException( output )
+            logger.debug("Opening ssh connection ... ")
+            keys = None
+            logger.debug("Trying ssh-agent ... " )
+            drm4g_agent = drm4g.commands.Agent()
+            drm4g_agent.start()
+            drm4g_agent.update_agent_env()
+            # paramiko agent
+            agent = Agent()
+            keys  = agent.get_keys()
+            if not keys :
+                logger.debug( "Error trying to connect to '%s'" % self.frontend )
+                logger.debug( "Impossible to load '%s' key from the ssh-agent"  % self.private_key )
+                try:
+                    status_ssh_agent = agent._conn
+                except Exception as err :
+                    logger.warning( "Probably you are using paramiko version <= 1.7.7.2 : %s " % err )
+                    status_ssh_agent = agent._conn
+                if not status_ssh_agent:
+                    logger.warning( "'ssh-agent' is not running" )
+                else:
+                    if agent.get_keys():
+                        logger.warning( "ssh-agent is running but none of the keys have been accepted"
+                        "by remote frontend %s." % self.frontend )
+                    else:
+                        logger.debug( "'ssh-agent' is running but without any keys" )
+            if self.private_key :
+                logger.debug("Trying '%s' key ... " % self.private_key )
+                private_key_path = expanduser( self.private_key )
+                if ( not exists( private_key_path ) ) and ( not 'PRIVATE KEY' in  self.private_key ):
+                    output = "'%s'key does not exist" % private_key_path
+                    raise ComException( output )
+                for pkey_class in (RSAKey, DSSKey):
+                    try :
+                        if 'PRIVATE KEY' in self.private_key : #TODO: Review this case
+                            key  = pkey_class.from_private_key( StringIO.StringIO ( self.private_key.strip( "'" ) ) )
+                        else :
+                            key  = pkey_class.from_private_key_file( private_key_path )
+                        keys = keys + (key,)
+                    except Exception :
+                        pass
+            if not keys :
+                output = "Impossible to load any keys"
+                logger.error( output )
+                raise ComException( output )
 
-                    for key in keys:
-                        try:
-                            sock = socket.socket()
-                            try:
-                                sock.settimeout( SSH_CONNECT_TIMEOUT )
-                            except :
-                                output = "Timeout trying to connect to '%s'" % self.frontend
-                                raise ComException( output )
-                            logger.debug( "Connecting to '%s' as user '%s' port  '%s' ..."
-                                               % ( self.frontend , self.username, self.port ) )
-                            if ':' in self.frontend :
-                                self.frontend , self.port = self.frontend.split( ':' )
-                            sock.connect( ( self.frontend , self.port ) )
-                            self._trans      = Transport( sock )
-                            self._trans.connect( username = self.username , pkey = key )
-                            if self._trans.is_authenticated( ) :
-                                break
-                        except socket.gaierror:
-                            output = "Could not resolve hostname '%s' " % self.frontend
-                            raise ComException( output )
-                        except Exception as  err :
-                            logger.warning( "Error connecting '%s': %s" % ( self.frontend , str ( err ) ) )
-                if not self._trans :
-                    output = "Authentication failed for '%s'. Try to execute `ssh -vvv -p %d %s@%s` and see the response." % (
-                              self.frontend , self.port, self.username, self.frontend )
-                    raise ComException( output  )
+            if ':' in self.frontend :
+                frontend , port = self.frontend.split( ':' )
+            else :
+                frontend , port = self.frontend , self.port
+            for key in keys:
+                try:
+                    sock = socket.socket()
+                    try:
+                        sock.settimeout( SSH_CONNECT_TIMEOUT )
+                    except :
+                        output = "Timeout trying to connect to '%s'" % frontend
+                        raise ComException( output )
+                    logger.debug( "Connecting to '%s' as user '%s' port  '%s' ..."
+                                       % ( frontend , self.username, port ) )
+                    sock.connect( ( frontend , int( port ) ) )
+                    transport = Transport( sock )
+                    transport.connect( username = self.username , pkey = key )
+                    if transport.is_authenticated( ) :
+                        return transport
+                    transport.close( )
+                except socket.gaierror:
+                    output = "Could not resolve hostname '%s' " % frontend
+                    raise ComException( output )
+                except Exception as  err :
+                    logger.warning( "Error connecting '%s': %s" % ( frontend , str ( err ) ) )
+            output = "Authentication failed for '%s'. Try to execute `ssh -vvv -p %s %s@%s` and see the response." % (
+                      frontend , port, self.username, frontend )
+            raise ComException( output  )
         except ComException:
             raise
         except Exception as err:
@@ -130,20 +247,36 @@ class Communicator(drm4g.communicators.Communicator):
             else:
                 raise
 
+    def _open_session(self):
+        """
+        Lease a channel from the pool of the host, replacing the transport
+        once if it turns out to be broken.
+        """
+        pool = self._pool( )
+        for attempt in range( 2 ) :
+            transport = pool.lease( )
+            try :
+                return transport, transport.open_session( )
+            except Exception as err :
+                logger.debug( "Could not open a channel to '%s': %s" % ( self.frontend, str( err ) ) )
+                pool.discard( transport )
+                if attempt :
+                    raise ComException( "Could not open a channel to '%s': %s" % ( self.frontend, str( err ) ) )
+
     def execCommand(self , command , input=""):
-        self.connect()
-        with self._lock :
-            channel = self._trans.open_session()
-        channel.settimeout( SSH_CONNECT_TIMEOUT )
-        channel.exec_command( command )
-        if input :
-            for line in input.split( ):
-                channel.makefile( 'w').write( '%s\n' % line )
-                channel.makefile( 'w' ).flush( )
-        stdout = ''.join( channel.makefile( 'r').readlines( ) )
-        stderr = ''.join( channel.makefile_stderr( 'r').readlines( ) )
-        if channel :
+        transport, channel = self._open_session( )
+        try :
+            channel.settimeout( SSH_CONNECT_TIMEOUT )
+            channel.exec_command( command )
+            if input :
+                for line in input.split( ):
+                    channel.makefile( 'w').write( '%s\n' % line )
+                    channel.makefile( 'w' ).flush( )
+            stdout = ''.join( channel.makefile( 'r').readlines( ) )
+            stderr = ''.join( channel.makefile_stderr( 'r').readlines( ) )
             channel.close( )
+        finally :
+            self._pool( ).release( transport )
         return stdout , stderr
 
     def mkDirectory(self, url):
@@ -159,37 +292,59 @@ class Communicator(drm4g.communicators.Communicator):
             raise ComException( "Could not remove %s directory on '%s': %s" % ( to_dir , self.frontend , stderr ) )
 
     def copy( self , source_url , destination_url , execution_mode = '' ) :
-        with self._sem :
-            self.connect( )
-            scp = SCPClient( self._trans )
-            if 'file://' in source_url :
-                from_dir = urlparse( source_url ).path
-                to_dir   = self._set_dir( urlparse( destination_url ).path )
-                logger.debug( "Putting '%s' -> '%s'" %  (from_dir, to_dir  ))
-                scp.put( from_dir , to_dir )
-                if execution_mode == 'X':
-                    stdout, stderr = self.execCommand( "chmod +x %s" % to_dir )
-            else:
-                from_dir = self._set_dir( urlparse( source_url ).path )
-                to_dir   = urlparse(destination_url).path
-                logger.debug( "Getting '%s' -> '%s'" %  (from_dir, to_dir  ))
-                scp.get( from_dir, to_dir )
+        error = self.copyFiles( [ ( source_url , destination_url , execution_mode ) ] )[ 0 ]
+        if error :
+            raise ComException( error )
 
+    def copyFiles( self , transfers ) :
+        """
+        Copy several files through the same SCP client and give execute
+        permissions to all of them with a single command.
+        """
+        from scp import SCPClient
+        errors     = []
+        executable = []
+        with self._sem :
+            pool      = self._pool( )
+            transport = pool.lease( )
+            try :
+                scp = SCPClient( transport )
+                for source_url, destination_url, execution_mode in transfers :
+                    try :
+                        if 'file://' in source_url :
+                            from_dir = urlparse( source_url ).path
+                            to_dir   = self._set_dir( urlparse( destination_url ).path )
+                            logger.debug( "Putting '%s' -> '%s'" %  (from_dir, to_dir  ))
+                            scp.put( from_dir , to_dir )
+                            if execution_mode == 'X':
+                                executable.append( to_dir )
+                        else:
+                            from_dir = self._set_dir( urlparse( source_url ).path )
+                            to_dir   = urlparse(destination_url).path
+                            logger.debug( "Getting '%s' -> '%s'" %  (from_dir, to_dir  ))
+                            scp.get( from_dir, to_dir )
+                        errors.append( None )
+                    except Exception as err :
+                        errors.append( str( err ) )
+            finally :
+                pool.release( transport )
+        if executable :
+            stdout, stderr = self.execCommand( "chmod +x %s" % ' '.join( executable ) )
+        return errors
 
     def close( self ) :
+        """
+        Leave the pool of the host. Its transports are shared with the other
+        communicators of the host, so they are only closed by the last one.
+        """
+        with Communicator._pools_lock :
+            pool, self._transport_pool = self._transport_pool, None
         try :
-            if self._trans :
-                self._trans.close( )
+            if pool is not None :
+                pool.remove_user( )
         except Exception as err:
             logger.warning( "Could not close the SSH connection to '%s': %s" % ( self.frontend , str( err ) ) )
 
-    def __del__( self ) :
-        """
-        Attempt to clean up if not explicitly closed.
-        """
-        self.close( )
-
-
     #internal
     def _set_dir(self, path):
         work_directory =  re.compile( r'^~' ).sub( self.work_directory , path )
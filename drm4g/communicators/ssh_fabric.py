@@ -26,7 +26,7 @@ import fabric
 
 import drm4g.commands
 import drm4g.communicators
-from drm4g.communicators    import ComException, SFTP_CONNECTIONS
+from drm4g.communicators    import ComException
 from drm4g.utils.url        import urlparse
 
 import logging
@@ -37,7 +37,6 @@ class Communicator(drm4g.communicators.Communicator):
     Create a SSH session to remote resources.
     """
     _lock = threading.Lock()
-    _sem = threading.Semaphore(SFTP_CONNECTIONS)
     _conn = None
 
     def connect(self):
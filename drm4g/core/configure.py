@@ -18,9 +18,13 @@
 # permissions and limitations under the Licence.
 #
 
+import io
 import os
+import copy
 import pickle
+import hashlib
 import logging
+import threading
 from drm4g.utils.importlib import import_module
 from drm4g.communicators   import REMOTE_JOBS_DIR
 from drm4g                 import ( 
@@ -39,6 +43,17 @@ except ImportError :
 logger = logging.getLogger(__name__)
 pickled_file = os.path.join(DRM4G_DIR, "var", "rocci_pickled")
 
+# Parsed configuration files shared by all the Configuration objects
+_cache      = dict()
+_cache_lock = threading.Lock()
+
+def _stamp( stat ) :
+    """
+    Identify a version of a file. The mtime in nanoseconds and the inode
+    tell apart rewrites of the same size, even within the same second.
+    """
+    return ( stat.st_mtime_ns, stat.st_ino, stat.st_size )
+
 class ConfigureException(Exception):
     pass
 
@@ -70,58 +85,88 @@ class Configuration(object):
     def load(self):
         """
         Read the configuration file.
+
+        The parsed resources are cached for the whole process and reused
+        while the file does not change, which costs a stat() call (and a
+        hash of the content when only its stamp changed).
         """
         logger.debug("Reading file '%s' ..." % DRM4G_RESOURCES_CONF)
         try:
-            try:
-                conf_file   = open(DRM4G_RESOURCES_CONF, 'r')
-                parser = configparser.RawConfigParser()
-                try:
-                    parser.readfp( conf_file , DRM4G_RESOURCES_CONF )
-                except Exception as err:
-                    output = "Configuration file '%s' is unreadable or malformed: %s" % ( DRM4G_RESOURCES_CONF , str( err ) )
-                    logger.error( output )
+            stat  = os.stat( DRM4G_RESOURCES_CONF )
+            with _cache_lock :
+                entry = _cache.get( DRM4G_RESOURCES_CONF )
+            if entry and entry[ 'stamp' ] == _stamp( stat ) :
+                self.resources.update( copy.deepcopy( entry[ 'resources' ] ) )
+                return
+            with open( DRM4G_RESOURCES_CONF, 'r' ) as conf_file :
+                content = conf_file.read()
+            digest = hashlib.sha1( content.encode( 'utf-8' ) ).hexdigest()
+            if entry and entry[ 'digest' ] == digest :
+                with _cache_lock :
+                    entry[ 'stamp' ] = _stamp( stat )
+                self.resources.update( copy.deepcopy( entry[ 'resources' ] ) )
+                return
+            resources = self._parse( content )
+            self.resources.update( resources )
+            # VM instances of rocci resources are read from other files
+            if not [ resdict for resdict in resources.values() if resdict.get( 'lrms' ) == 'rocci' ] :
+                with _cache_lock :
+                    _cache[ DRM4G_RESOURCES_CONF ] = dict( stamp = _stamp( stat ), digest = digest,
+                                                           resources = copy.deepcopy( resources ), checked = None )
+        except Exception as err:
+            output = "Error reading '%s' file: %s" % (DRM4G_RESOURCES_CONF, str(err))
+            logger.error( output )
 
-                for sectname in parser.sections():
-                    name                   = sectname
-                    logger.debug(" Reading configuration for resource '%s'." % name )
-                    self.resources[ name ] = dict( parser.items( sectname ) )
-
-                    if self.resources[ name ][ 'lrms' ] == "rocci" :
-                        if os.path.exists( os.path.join( pickled_file+"_"+name ) ):
-                            try:
-                                instances = []
-                                with open( pickled_file+"_"+name, "r" ) as pf :
-                                    while True :
-                                        try:
-                                            instances.append( pickle.load( pf ) )
-                                        except EOFError :
-                                            break
-                                if not instances :
-                                    pass
-                                if instances:
-                                    for instance in instances :
-                                        insdict = dict()
-                                        insdict['username'] = instance.vm_user
-                                        insdict['frontend'] = instance.ext_ip
-                                        insdict['communicator'] = instance.vm_comm
-                                        insdict['private_key'] = instance.private_key
-                                        insdict['enable'] = 'true'
-                                        insdict['lrms'] = 'fork'
-                                        insdict['max_jobs_running'] = instance.max_jobs_running
-                                        self.resources[ name+"_"+instance.ext_ip ] = insdict
-                                        logger.debug("Resource '%s' defined by: %s.",
-                                                name+"_"+instance.ext_ip, ', '.join([("%s=%s" % (k,v)) for k,v in sorted(self.resources[name+"_"+instance.ext_ip].items())]))
-                            except Exception as err :
-                                raise Exception( "Could not create resource for the VMs of %s:\n%s" % (name,str(err)) )
-
-                    logger.debug("Resource '%s' defined by: %s.",
-                             sectname, ', '.join([("%s=%s" % (k,v)) for k,v in sorted(self.resources[name].items())]))
-            except Exception as err:
-                output = "Error reading '%s' file: %s" % (DRM4G_RESOURCES_CONF, str(err))
-                logger.error( output )
-        finally:
-            conf_file.close()
+    def _parse(self, content):
+        """
+        Parse the content of the configuration file.
+
+        Return a dictionary, mapping the resource name into its keys.
+        """
+        resources = dict()
+        parser = configparser.RawConfigParser()
+        try:
+            parser.readfp( io.StringIO( content ) , DRM4G_RESOURCES_CONF )
+        except Exception as err:
+            output = "Configuration file '%s' is unreadable or malformed: %s" % ( DRM4G_RESOURCES_CONF , str( err ) )
+            logger.error( output )
+
+        for sectname in parser.sections():
+            name                   = sectname
+            logger.debug(" Reading configuration for resource '%s'." % name )
+            resources[ name ] = dict( parser.items( sectname ) )
+
+            if resources[ name ][ 'lrms' ] == "rocci" :
+                if os.path.exists( os.path.join( pickled_file+"_"+name ) ):
+                    try:
+                        instances = []
+                        with open( pickled_file+"_"+name, "r" ) as pf :
+                            while True :
+                                try:
+                                    instances.append( pickle.load( pf ) )
+                                except EOFError :
+                                    break
+                        if not instances :
+                            pass
+                        if instances:
+                            for instance in instances :
+                                insdict = dict()
+                                insdict['username'] = instance.vm_user
+                                insdict['frontend'] = instance.ext_ip
+                                insdict['communicator'] = instance.vm_comm
+                                insdict['private_key'] = instance.private_key
+                                insdict['enable'] = 'true'
+                                insdict['lrms'] = 'fork'
+                                insdict['max_jobs_running'] = instance.max_jobs_running
+                                resources[ name+"_"+instance.ext_ip ] = insdict
+                                logger.debug("Resource '%s' defined by: %s.",
+                                        name+"_"+instance.ext_ip, ', '.join([("%s=%s" % (k,v)) for k,v in sorted(resources[name+"_"+instance.ext_ip].items())]))
+                    except Exception as err :
+                        raise Exception( "Could not create resource for the VMs of %s:\n%s" % (name,str(err)) )
+
+            logger.debug("Resource '%s' defined by: %s.",
+                     sectname, ', '.join([("%s=%s" % (k,v)) for k,v in sorted(resources[name].items())]))
+        return resources
 
     def check(self):
         """
@@ -129,6 +174,42 @@ class Configuration(object):
 
         Return a list with the errors.
         """
+        with _cache_lock :
+            entry = _cache.get( DRM4G_RESOURCES_CONF )
+        stamps = self._file_stamps()
+        if entry and entry[ 'checked' ] and entry[ 'resources' ] == self.resources :
+            checked_resources, errors, checked_stamps = entry[ 'checked' ]
+            if checked_stamps == stamps :
+                self.resources.update( copy.deepcopy( checked_resources ) )
+                return list( errors )
+        loaded_resources = copy.deepcopy( self.resources )
+        errors = self._check()
+        if entry and entry[ 'resources' ] == loaded_resources :
+            with _cache_lock :
+                entry[ 'checked' ] = ( copy.deepcopy( self.resources ), list( errors ), stamps )
+        return errors
+
+    def _file_stamps(self):
+        """
+        Return the stamps of the key and certificate files of the
+        resources, None for the missing ones. The result of check() depends
+        on them as well as on the configuration file.
+        """
+        stamps = []
+        for resname, resdict in sorted( self.resources.items() ) :
+            private_key = resdict.get( 'private_key' )
+            public_key  = resdict.get( 'public_key' ) or ( private_key and private_key + '.pub' )
+            for path in ( private_key, public_key, resdict.get( 'grid_cert' ) ) :
+                if not path :
+                    continue
+                path = os.path.expandvars( os.path.expanduser( path ) )
+                try :
+                    stamps.append( ( path, _stamp( os.stat( path ) ) ) )
+                except OSError :
+                    stamps.append( ( path, None ) )
+        return stamps
+
+    def _check(self):
         errors = []
         for resname, resdict in list(self.resources.items()) :
             logger.debug("Checking resource '%s' ..." % resname)
@@ -238,23 +319,30 @@ class Configuration(object):
         Return a dictionary, mapping the resource name into the corresponding objects.
         """
         communicators = dict()
-        for name, resdict in list(self.resources.items()):
+        for name in list(self.resources.keys()):
             try:
-                communicator              = self._import_manager(COMMUNICATORS, resdict[ 'communicator' ] )
-                com_object                = getattr( communicator , 'Communicator' ) ()
-                com_object.username       = resdict.get( 'username' )
-                com_object.frontend       = resdict.get( 'frontend' )
-                com_object.private_key    = resdict.get( 'private_key' )
-                com_object.public_key     = resdict.get( 'public_key' )
-                com_object.work_directory = resdict.get( 'scratch', REMOTE_JOBS_DIR )
-                communicators[name]       = com_object
-                logger.debug("Communicator of resource '%s' is defined by: %s.",
-                    name, ', '.join([("%s=%s" % (k,v)) for k,v in sorted(communicators[name].__dict__.items())]))
+                communicators[name] = self.make_communicator(name)
             except Exception as err:
                 output = "Failed creating communicator for resource '%s' : %s" % ( name, str( err ) )
                 logger.warning( output , exc_info=1 )
         return communicators
 
+    def make_communicator(self, name):
+        """
+        Make the communicator object of the resource called name.
+        """
+        resdict                   = self.resources[ name ]
+        communicator              = self._import_manager(COMMUNICATORS, resdict[ 'communicator' ] )
+        com_object                = getattr( communicator , 'Communicator' ) ()
+        com_object.username       = resdict.get( 'username' )
+        com_object.frontend       = resdict.get( 'frontend' )
+        com_object.private_key    = resdict.get( 'private_key' )
+        com_object.public_key     = resdict.get( 'public_key' )
+        com_object.work_directory = resdict.get( 'scratch', REMOTE_JOBS_DIR )
+        logger.debug("Communicator of resource '%s' is defined by: %s.",
+            name, ', '.join([("%s=%s" % (k,v)) for k,v in sorted(com_object.__dict__.items())]))
+        return com_object
+
     def make_resources(self):
         """
         Make manager objects corresponding to the configured resources.
@@ -262,22 +350,36 @@ class Configuration(object):
         Return a dictionary, mapping the resource name into the corresponding objects.
         """
         resources = dict()
-        for name, resdict in list(self.resources.items()):
+        for name in list(self.resources.keys()):
             try:
-                resources[name]             = dict()
-                manager                     = self._import_manager(RESOURCE_MANAGERS, resdict[ 'lrms' ] )
-                resource_object             = getattr( manager , 'Resource' ) ()
-                resource_object.name        = name
-                resource_object.features    = resdict
-                job_object                  = getattr( manager , 'Job' ) ()
-                job_object.resfeatures      = resdict
-                resources[name]['Resource'] = resource_object
-                resources[name]['Job']      = job_object
+                resources[name] = self.make_resource(name)
             except Exception as err:
+                resources[name] = dict()
                 output = "Failed creating objects for resource '%s' of type : %s" % ( name, str( err ) )
                 logger.warning( output , exc_info=1 )
         return resources
-    
+
+    def make_resource(self, name):
+        """
+        Make the manager objects of the resource called name.
+
+        Return a dictionary with the 'Resource' and 'Job' objects.
+        """
+        resdict                     = self.resources[ name ]
+        manager                     = self.get_manager( name )
+        resource_object             = getattr( manager , 'Resource' ) ()
+        resource_object.name        = name
+        resource_object.features    = resdict
+        job_object                  = getattr( manager , 'Job' ) ()
+        job_object.resfeatures      = resdict
+        return { 'Resource' : resource_object, 'Job' : job_object }
+
+    def get_manager(self, name):
+        """
+        Return the manager module used by the resource called name.
+        """
+        return self._import_manager(RESOURCE_MANAGERS, self.resources[ name ][ 'lrms' ] )
+
     def _import_manager(self, MANAGERS, manager):
         """
         Auxiliar function to return module imported from MANAGERS, been referencied by manager.
@@ -19,15 +19,23 @@
 #
 
 import sys
+import math
 import time
+import heapq
+import asyncio
 import threading
+from collections             import deque
 import logging
 from os.path                 import join, dirname
+from drm4g                   import DRM4G_DIR_VAR
 from drm4g.communicators     import REMOTE_JOBS_DIR
+from drm4g.managers          import H_M_S_to_sec
 from drm4g.utils.rsl2        import Rsl2Parser
 from drm4g.utils.list        import List
+from drm4g.utils.registry    import JobRegistry
 from drm4g.core.configure    import Configuration
 from drm4g.utils.dynamic     import ThreadPool
+from drm4g.utils.aio         import get_event_loop
 from drm4g.utils.message     import Send
 
 
@@ -76,13 +84,37 @@ class GwEmMad (object):
     message = Send()
 
     def __init__(self):
-        self._callback_interval = 30 #seconds
+        self._callback_interval = 30  #seconds, maximum interval for active jobs
+        self._min_callback_interval = 5    #seconds, first check after a submission
+        self._poll_tick         = 5   #seconds, deadlines are rounded up to multiples of it
+        self._max_callback_interval = 300  #seconds, maximum interval for pending jobs
+        self._poll_queue        = []
+        self._poll_info         = dict()
+        self._poll_cond         = threading.Condition()
         self._max_thread        = 10
         self._min_thread        = 3
+        self._max_resource_thread = 2
+        self._resource_sem      = dict()
+        self._pool              = None
+        self._loop              = None
+        self._status_timeout    = 120 #seconds, maximum wait for the status of the jobs of a resource
+        self._jid_tasks         = dict()
+        self._jid_lock          = threading.Lock()
         self._job_list          = List()
         self._configure         = None
         self._communicators     = dict()
+        self._managers          = dict()
         self._lock              = threading.Lock()
+        self._registry_file     = join( DRM4G_DIR_VAR, 'em_jobs.db' )
+        self._registry          = None
+        self._recovered         = dict()
+        self._recovered_ready   = threading.Event()
+        self._recovered_ready.set()
+        self._recovering        = dict() # HOST -> Event set once its jobs are checked
+        self._recover_timeout   = 30     #seconds, maximum wait of a RECOVER for its host
+        self._array_window      = 2   #seconds, time to gather the tasks of an array
+        self._arrays            = dict()
+        self._array_lock        = threading.Lock()
 
     def do_INIT(self, args):
         """
@@ -99,8 +131,11 @@ class GwEmMad (object):
         Submits a job(i.e. SUBMIT JID HOST/JM RSL).
         @param args : arguments of operation
         @type args : string
+        @return: True if the job is kept for a job array and answered later
+        @rtype: bool
         """
         OPERATION, JID, HOST_JM, RSL = args.split()
+        job = None
         try:
             HOST, JM = HOST_JM.rsplit( '/', 1 )
             # Init Job class
@@ -125,17 +160,123 @@ class GwEmMad (object):
             # Create and copy wrapper_drm4g file
             local_file    = join( dirname ( RSL ), "wrapper_drm4g.%s" % RSL.split( '.' )[ -1 ] )
             remote_file   = join( dirname ( rsl[ 'executable' ] ), 'wrapper_drm4g' )
-            job.createWrapper( local_file, job.jobTemplate( rsl ) )
-            job.copyWrapper( local_file, remote_file )
-            # Execute wrapper_drm4g
-            job.JobId = job.jobSubmit( remote_file )
-            self._job_list.put( JID, job )
-            out = 'SUBMIT %s SUCCESS %s:%s' % ( JID, HOST, job.JobId )
+            template      = job.jobTemplate( rsl )
+            job.createWrapper( local_file, template )
+            # Tasks of an array are gathered and submitted together
+            if self._is_array_task( job, rsl ) :
+                self._add_array_task( JID, HOST, job, rsl, local_file, remote_file, template )
+                return True
+            # Copy and execute wrapper_drm4g
+            job.JobId = job.jobStageSubmit( local_file, remote_file, template )
+            out = self._submitted( JID, HOST, job, rsl )
         except Exception as err:
-            out = 'SUBMIT %s FAILURE %s' % ( JID, str( err ) )
-            self.logger.error( err , exc_info=1 )
+            out = self._submit_failed( JID, job, err )
         self.message.stdout(out)
         self.logger.debug(out)
+        return False
+
+    def _submitted(self, JID, HOST, job, rsl):
+        self._job_list.put( JID, job )
+        self._register( JID, HOST, job )
+        self._schedule( JID, job, walltime = rsl.get( 'maxWallTime' ) )
+        return 'SUBMIT %s SUCCESS %s:%s' % ( JID, HOST, job.JobId )
+
+    def _forget(self, JID):
+        """
+        Undo _submitted for a job that is reported as failed.
+        """
+        self._job_list.delete( JID )
+        self._unschedule( JID )
+        if self._registry :
+            try :
+                self._registry.delete( JID )
+            except Exception as err :
+                self.logger.warning( "Could not unregister job %s: %s" % ( JID, str( err ) ) )
+
+    def _submit_failed(self, JID, job, err):
+        if job and job.Communicator :
+            job.invalidate_abs_directory( job.resfeatures.get( 'scratch', REMOTE_JOBS_DIR ) )
+        self.logger.error( err , exc_info=1 )
+        return 'SUBMIT %s FAILURE %s' % ( JID, str( err ) )
+
+    def _is_array_task(self, job, rsl):
+        environment = rsl.get( 'environment', dict() )
+        try :
+            return ( job.array_index is not None and
+                     int( environment.get( 'GW_ARRAY_ID', -1 ) ) >= 0 and
+                     int( environment.get( 'GW_TOTAL_TASKS', 1 ) ) > 1 )
+        except ValueError :
+            return False
+
+    def _add_array_task(self, JID, HOST, job, rsl, local_file, remote_file, template):
+        """
+        Keep a task of an array until all the tasks of the array sent to the
+        same resource with the same requirements arrive, or until
+        _array_window seconds pass, and then submit them as a single LRMS
+        job array.
+        """
+        requirements = tuple( sorted( ( k, str( v ) ) for k, v in list( rsl.items() )
+                              if k not in ( 'environment', 'executable', 'stdout', 'stderr', 'directory' ) ) )
+        key  = ( HOST, rsl[ 'environment' ][ 'GW_ARRAY_ID' ], requirements )
+        task = ( JID, HOST, job, rsl, local_file, remote_file, template )
+        with self._array_lock :
+            tasks = self._arrays.setdefault( key, [] )
+            tasks.append( task )
+            complete = len( tasks ) >= int( rsl[ 'environment' ][ 'GW_TOTAL_TASKS' ] )
+            if len( tasks ) == 1 and not complete :
+                timer = threading.Timer( self._array_window, self._submit_array, ( key, ) )
+                timer.daemon = True
+                timer.start()
+        if complete :
+            self._submit_array( key )
+
+    def _submit_array(self, key):
+        with self._array_lock :
+            tasks = self._arrays.pop( key, None )
+        if not tasks :
+            return
+        if len( tasks ) == 1 :
+            JID, HOST, job, rsl, local_file, remote_file, template = tasks[ 0 ]
+            try :
+                job.JobId = job.jobStageSubmit( local_file, remote_file, template )
+                out = self._submitted( JID, HOST, job, rsl )
+            except Exception as err :
+                out = self._submit_failed( JID, job, err )
+            self.message.stdout( out )
+            self.logger.debug( out )
+            self._resume_jid( JID )
+            return
+        _, _, job, _, local_file, remote_file, _ = tasks[ 0 ]
+        outs = []
+        try :
+            template = job.jobArrayTemplate( [ task[ 3 ] for task in tasks ] )
+            local_file  = join( dirname( local_file ), 'wrapper_drm4g_array' )
+            remote_file = join( dirname( remote_file ), 'wrapper_drm4g_array' )
+            job.createWrapper( local_file, template )
+            array_job_id = job.jobStageSubmit( local_file, remote_file, template )
+        except Exception as err :
+            outs = [ self._submit_failed( task[ 0 ], task[ 2 ], err ) for task in tasks ]
+        else :
+            try :
+                # All the task ids are computed before registering any task
+                job_ids = [ job.jobArrayTaskId( array_job_id, index ) for index in range( 1, len( tasks ) + 1 ) ]
+                for ( JID, HOST, task_job, rsl, _, _, _ ), job_id in zip( tasks, job_ids ) :
+                    task_job.JobId = job_id
+                    outs.append( self._submitted( JID, HOST, task_job, rsl ) )
+            except Exception as err :
+                # GridWay resubmits the whole array, so nothing of it is kept
+                for task in tasks :
+                    self._forget( task[ 0 ] )
+                job.JobId = array_job_id
+                try :
+                    job.jobCancel( )
+                except Exception as cancel_err :
+                    self.logger.warning( "Could not cancel the job array %s: %s" % ( array_job_id, str( cancel_err ) ) )
+                outs = [ self._submit_failed( task[ 0 ], task[ 2 ], err ) for task in tasks ]
+        for task, out in zip( tasks, outs ) :
+            self.message.stdout( out )
+            self.logger.debug( out )
+            self._resume_jid( task[ 0 ] )
 
     def do_FINALIZE(self, args):
         """
@@ -177,11 +318,20 @@ class GwEmMad (object):
         OPERATION, JID, HOST_JM, RSL = args.split()
         try:
             HOST, remote_job_id = HOST_JM.split( ':', 1 )
-            job , communicator  = self._update_resource( HOST )
-            job.Communicator    = communicator
-            job.JobId           = remote_job_id
-            job.refreshJobStatus( )
+            # Jobs found in the registry are checked on start up, one thread per host
+            self._recovered_ready.wait( self._recover_timeout )
+            host_ready = self._recovering.get( HOST )
+            if host_ready and not host_ready.wait( self._recover_timeout ) :
+                self.logger.debug( "RECOVER %s: the jobs of '%s' are still being checked" % ( JID, HOST ) )
+            job = self._recovered.pop( JID, None )
+            if job is None or job.JobId != remote_job_id :
+                job , communicator  = self._update_resource( HOST )
+                job.Communicator    = communicator
+                job.JobId           = remote_job_id
+                job.refreshJobStatus( )
             self._job_list.put( JID, job )
+            self._register( JID, HOST, job )
+            self._schedule( JID, job )
             out = 'RECOVER %s SUCCESS %s' % ( JID, job.getStatus( ) )
         except Exception as err:
             out = 'RECOVER %s FAILURE %s' % ( JID, str( err ) )
@@ -194,25 +344,178 @@ class GwEmMad (object):
         Show the state of the job
         """
         while True:
-            time.sleep( self._callback_interval )
-            self.logger.debug( "CALLBACK new iteration ..." )
-            for JID , job in self._job_list.items( ):
-                try:
+            jobs = self._due_jobs( )
+            if jobs :
+                self.logger.debug( "CALLBACK new iteration for %d jobs ..." % len( jobs ) )
+                self._callback_sweep( jobs )
+
+    def _callback_sweep(self, jobs):
+        """
+        Refresh the state of the jobs given and notify the changes.
+        The jobs are grouped by resource so that each resource is queried once.
+        The queries are awaited in the event loop, so a resource slow to
+        answer does not hold a thread of the pool.
+        @param jobs : list of (JID, job) tuples
+        @type jobs : list
+        """
+        resources = dict()
+        for JID, job in jobs :
+            resources.setdefault( ( job.__class__, job.Communicator ), [] ).append( ( JID, job ) )
+        for ( job_class, communicator ), res_jobs in list( resources.items() ) :
+            if not self._pool :
+                self._refresh_resource_jobs( job_class, communicator, res_jobs )
+                continue
+            with self._lock :
+                sem = self._resource_sem.setdefault( communicator, threading.Semaphore( self._max_resource_thread ) )
+            # A resource that is not answering must not take up every thread of the pool
+            if sem.acquire( False ) :
+                if self._loop :
+                    self._loop.submit( self._query_resource_jobs( sem, job_class, communicator, res_jobs ) )
+                else :
+                    self._pool.add_task( self._refresh_resource_task, sem, job_class, communicator, res_jobs )
+            else :
+                self.logger.debug( "CALLBACK '%s' is busy, its jobs will be checked later" % communicator.frontend )
+                for JID, job in res_jobs :
+                    self._schedule( JID, job, interval = self._callback_interval )
+
+    async def _query_resource_jobs(self, sem, job_class, communicator, jobs):
+        """
+        Query the state of the jobs of a resource in the event loop and
+        hand the results over to the pool, which notifies them and refreshes
+        one by one the jobs missing from the answer.
+        """
+        try:
+            self.logger.debug( "CALLBACK checking %d jobs on '%s'" % ( len( jobs ), communicator.frontend ) )
+            status = await asyncio.wait_for( job_class.jobsStatusAsync( communicator, [ job.JobId for _, job in jobs ] ),
+                                             self._status_timeout )
+        except Exception as err:
+            self.logger.warning( "Could not check the jobs on '%s' at once: %s" % ( communicator.frontend, str( err ) ) )
+            status = dict()
+        self._pool.add_task( self._refresh_resource_task, sem, job_class, communicator, jobs, status )
+
+    def _refresh_resource_task(self, sem, job_class, communicator, jobs, status=None):
+        try:
+            self._refresh_resource_jobs( job_class, communicator, jobs, status )
+        except Exception as err:
+            self.logger.error( err , exc_info=1 )
+        finally:
+            sem.release()
+
+    def _schedule(self, JID, job, walltime=None, interval=None):
+        """
+        Compute when the state of a job has to be checked again.
+
+        Jobs are checked shortly after being submitted. Afterwards, the
+        interval grows with the time spent in the current state, so jobs
+        pending for a long time in a queue are polled less and less often,
+        up to _max_callback_interval. Active jobs are never polled less
+        often than _callback_interval, and they are checked as soon as
+        their maxWallTime is reached.
+        """
+        now    = time.time()
+        status = job.getStatus( )
+        with self._poll_cond :
+            info = self._poll_info.get( JID )
+            if info is None :
+                info = self._poll_info[ JID ] = { 'status' : status, 'since' : now, 'walltime' : None }
+            elif info[ 'status' ] != status :
+                info[ 'status' ] = status
+                info[ 'since' ]  = now
+            if walltime :
+                try :
+                    info[ 'walltime' ] = H_M_S_to_sec( walltime )
+                except ValueError :
+                    self.logger.debug( "Wrong maxWallTime '%s' for job %s" % ( walltime, JID ) )
+            if interval is None :
+                elapsed = now - info[ 'since' ]
+                if status == 'ACTIVE' :
+                    max_interval = self._callback_interval
+                else :
+                    max_interval = self._max_callback_interval
+                interval = min( max( elapsed / 4, self._min_callback_interval ), max_interval )
+                if status == 'ACTIVE' and info[ 'walltime' ] :
+                    end_time = info[ 'since' ] + info[ 'walltime' ]
+                    if now < end_time < now + interval :
+                        interval = end_time - now + self._min_callback_interval
+            # Jobs due within the same tick share the deadline, so the jobs
+            # of a resource are checked together with a single query
+            info[ 'deadline' ] = math.ceil( ( now + interval ) / self._poll_tick ) * self._poll_tick
+            heapq.heappush( self._poll_queue, ( info[ 'deadline' ], JID ) )
+            self._poll_cond.notify( )
+
+    def _unschedule(self, JID):
+        with self._poll_cond :
+            self._poll_info.pop( JID, None )
+
+    def _due_jobs(self):
+        """
+        Wait until some jobs have to be checked and return them as a list
+        of (JID, job) tuples.
+        """
+        with self._poll_cond :
+            while True :
+                now  = time.time()
+                jobs = []
+                while self._poll_queue and self._poll_queue[ 0 ][ 0 ] <= now :
+                    deadline, JID = heapq.heappop( self._poll_queue )
+                    info = self._poll_info.get( JID )
+                    # Discard entries of finished or rescheduled jobs
+                    if not info or info[ 'deadline' ] != deadline :
+                        continue
+                    job = self._job_list.get( JID )
+                    if job is None :
+                        del self._poll_info[ JID ]
+                        continue
+                    jobs.append( ( JID, job ) )
+                if jobs :
+                    return jobs
+                if self._poll_queue :
+                    self._poll_cond.wait( self._poll_queue[ 0 ][ 0 ] - now )
+                else :
+                    self._poll_cond.wait( self._callback_interval )
+
+    def _refresh_resource_jobs(self, job_class, communicator, jobs, status=None):
+        """
+        Refresh the state of several jobs of the same resource with one bulk
+        status query, falling back to one query per job if it is not supported.
+        The result of the bulk query is given in status when it has already
+        been made.
+        """
+        if status is None :
+            try:
+                self.logger.debug( "CALLBACK checking %d jobs on '%s'" % ( len( jobs ), communicator.frontend ) )
+                status = job_class.jobsStatus( communicator, [ job.JobId for _, job in jobs ] )
+            except Exception as err:
+                self.logger.warning( "Could not check the jobs on '%s' at once: %s" % ( communicator.frontend, str( err ) ) )
+                status = dict()
+        for JID, job in jobs :
+            try:
+                oldStatus = job.getStatus( )
+                if job.JobId in status :
+                    job.setStatus( status[ job.JobId ] )
+                else :
                     self.logger.debug( "CALLBACK checking job '%s'" % JID  )
-                    oldStatus = job.getStatus( )
                     job.refreshJobStatus( )
-                    newStatus = job.getStatus( )
-                    if oldStatus != newStatus or newStatus == 'DONE' or newStatus == 'FAILED':
-                        if newStatus == 'DONE' or newStatus == 'FAILED':
-                            self._job_list.delete(JID)
-                            time.sleep ( 0.1 )
-                        out = 'CALLBACK %s SUCCESS %s' % ( JID, newStatus )
-                        self.message.stdout( out )
-                        self.logger.debug( out )
-                except Exception as err:
-                    out = 'CALLBACK %s FAILURE %s' % ( JID, str( err ) )
-                    self.logger.error( err , exc_info=1 )
+                newStatus = job.getStatus( )
+                if newStatus == 'DONE' or newStatus == 'FAILED':
+                    self._job_list.delete(JID)
+                    self._unschedule( JID )
+                    if self._registry :
+                        self._registry.delete( JID )
+                    time.sleep ( 0.1 )
+                else :
+                    if self._registry and oldStatus != newStatus :
+                        self._registry.update( JID, newStatus )
+                    self._schedule( JID, job )
+                if oldStatus != newStatus or newStatus == 'DONE' or newStatus == 'FAILED':
+                    out = 'CALLBACK %s SUCCESS %s' % ( JID, newStatus )
                     self.message.stdout( out )
+                    self.logger.debug( out )
+            except Exception as err:
+                self._schedule( JID, job, interval = self._callback_interval )
+                out = 'CALLBACK %s FAILURE %s' % ( JID, str( err ) )
+                self.logger.error( err , exc_info=1 )
+                self.message.stdout( out )
 
     def do_CANCEL(self, args):
         """
@@ -223,7 +526,9 @@ class GwEmMad (object):
         OPERATION, JID, HOST_JM, RSL = args.split()
         try:
             if self._job_list.has_key( JID ) :
-                self._job_list.get(JID).jobCancel()
+                job = self._job_list.get(JID)
+                job.jobCancel()
+                self._schedule( JID, job, interval = self._min_callback_interval )
                 out = 'CANCEL %s SUCCESS -' % (JID)
             else:
                 out = 'CANCEL %s FAILURE Job not submitted' % (JID)
@@ -249,17 +554,27 @@ class GwEmMad (object):
             worker.setDaemon( True )
             worker.start()
             self._configure = Configuration()
-            pool = ThreadPool( self._min_thread, self._max_thread )
+            self._pool = ThreadPool( self._min_thread, self._max_thread )
+            self._loop = get_event_loop()
+            try:
+                self._registry = JobRegistry( self._registry_file )
+            except Exception as err:
+                self.logger.warning( "Could not open the job registry '%s': %s" % ( self._registry_file, str( err ) ) )
+            else:
+                self._recovered_ready.clear()
+                loader = threading.Thread( target = self._load_registry, )
+                loader.setDaemon( True )
+                loader.start()
             while True:
                 input = sys.stdin.readline().split()
                 self.logger.debug( ' '.join(input) )
                 if len(input)>0:
                     OPERATION = input[0].upper()
                     if len(input) == 4 and OPERATION in self.methods:
-                        if OPERATION in ( 'FINALIZE', 'INIT', 'SUBMIT', 'RECOVER' ):
+                        if OPERATION in ( 'FINALIZE', 'INIT' ):
                             self.methods[ OPERATION ]( self, ' '.join(input) )
                         else:
-                            pool.add_task( self.methods[ OPERATION ], self, ' '.join(input) )
+                            self._dispatch( input[ 1 ], self.methods[ OPERATION ], ' '.join(input) )
                     else:
                         out = 'WRONG COMMAND'
                         self.message.stdout( out )
@@ -267,28 +582,138 @@ class GwEmMad (object):
         except Exception as err:
             self.logger.warning( str ( err ) , exc_info=1 )
 
+    def _dispatch(self, JID, method, args):
+        """
+        Run an operation in the thread pool. Operations on different jobs
+        run concurrently, while the ones on the same JID are run one after
+        another in the order they were received.
+        """
+        with self._jid_lock :
+            if JID in self._jid_tasks :
+                self._jid_tasks[ JID ].append( ( method, args ) )
+                return
+            self._jid_tasks[ JID ] = deque()
+        self._pool.add_task( self._run_jid_tasks, JID, method, args )
+
+    def _run_jid_tasks(self, JID, method, args):
+        while True:
+            try:
+                deferred = method( self, args )
+            except Exception as err:
+                deferred = False
+                self.logger.error( err , exc_info=1 )
+            # The tasks of a job array are answered when the array is
+            # submitted, the next operations on the JID wait until then
+            if deferred :
+                return
+            with self._jid_lock :
+                if self._jid_tasks[ JID ] :
+                    method, args = self._jid_tasks[ JID ].popleft()
+                else :
+                    del self._jid_tasks[ JID ]
+                    return
+
+    def _resume_jid(self, JID):
+        """
+        Run the operations queued for JID while its SUBMIT was deferred.
+        """
+        with self._jid_lock :
+            if JID not in self._jid_tasks :
+                return
+            if not self._jid_tasks[ JID ] :
+                del self._jid_tasks[ JID ]
+                return
+            method, args = self._jid_tasks[ JID ].popleft()
+        self._pool.add_task( self._run_jid_tasks, JID, method, args )
+
+    def _register(self, JID, HOST, job):
+        if not self._registry :
+            return
+        try:
+            self._registry.put( JID, HOST, job.JobId, job.getStatus( ) )
+        except Exception as err:
+            self.logger.warning( "Could not register job %s: %s" % ( JID, str( err ) ) )
+
+    def _load_registry(self):
+        """
+        Rebuild the jobs stored in the registry by a previous execution of
+        the MAD. The state of the jobs of each host is checked in its own
+        thread with one query, so a frontend that does not answer does not
+        delay the rest. They are handed to GridWay when it asks for them
+        with RECOVER.
+        """
+        try:
+            hosts = dict()
+            for JID, HOST, job_id, status in self._registry.items() :
+                hosts.setdefault( HOST, [] ).append( ( JID, job_id, status ) )
+            for HOST, host_jobs in list( hosts.items() ) :
+                self._recovering[ HOST ] = threading.Event()
+                worker = threading.Thread( target = self._recover_host, args = ( HOST, host_jobs ) )
+                worker.setDaemon( True )
+                worker.start()
+        except Exception as err:
+            self.logger.error( err , exc_info=1 )
+        finally:
+            self._recovered_ready.set()
+
+    def _recover_host(self, HOST, host_jobs):
+        self.logger.debug( "Recovering %d jobs of '%s' from the registry" % ( len( host_jobs ), HOST ) )
+        try:
+            job, communicator = self._update_resource( HOST )
+            status = job.__class__.jobsStatus( communicator, [ job_id for _, job_id, _ in host_jobs ] )
+            for JID, job_id, old_status in host_jobs :
+                if job_id not in status :
+                    continue
+                recovered              = job.__class__()
+                recovered.resfeatures  = dict( job.resfeatures )
+                recovered.Communicator = communicator
+                recovered.JobId        = job_id
+                recovered.setStatus( status[ job_id ] )
+                self._recovered[ JID ] = recovered
+                if status[ job_id ] == 'DONE' or status[ job_id ] == 'FAILED':
+                    self._registry.delete( JID )
+                elif status[ job_id ] != old_status :
+                    self._registry.update( JID, status[ job_id ] )
+        except Exception as err:
+            self.logger.warning( "Could not recover the jobs of '%s': %s" % ( HOST, str( err ) ) )
+        finally:
+            self._recovering[ HOST ].set()
+
     def _update_resource(self, host):
+        """
+        Return a new Job object and the communicator of the resource used
+        by host. Manager modules and communicators are cached per resource
+        and only rebuilt when the configuration file changes.
+        """
         with self._lock :
-            if not self._configure.check_update() or not self._configure.resources :
+            if self._configure.check_update() or not self._configure.resources :
+                old_resources = self._configure.resources
+                self._configure.resources = dict()
                 self._configure.load()
                 errors = self._configure.check()
                 if errors :
+                    self._configure.resources = old_resources
                     self.logger.error ( ' '.join( errors ) )
                     raise Exception ( ' '.join( errors ) )
-            for resname, resdict in list( self._configure.resources.items() ) :
-                if  'cloud_provider' in self._configure.resources[ resname ].keys():
-                    continue
-                if '::' in host :
-                    _resname , _ = host.split( '::' )
-                    if resname != _resname :
-                        continue
-                elif resname != host :
-                    continue
-                if resname not in self._communicators :
-                    self._communicators[ resname ] = self._configure.make_communicators()[resname]
-                job          = self._configure.make_resources()[ resname ]['Job']
-                communicator = self._communicators[ resname ]
-                return job, communicator
+                self._managers.clear()
+                for resname in list( self._communicators.keys() ) :
+                    if old_resources.get( resname ) != self._configure.resources.get( resname ) :
+                        del self._communicators[ resname ]
+            if '::' in host :
+                resname , _ = host.split( '::' )
+            else :
+                resname = host
+            resdict = self._configure.resources.get( resname )
+            if not resdict or 'cloud_provider' in resdict :
+                raise Exception( "Resource '%s' is not configured" % resname )
+            if resname not in self._managers :
+                self._managers[ resname ] = self._configure.get_manager( resname )
+            if resname not in self._communicators :
+                self._communicators[ resname ] = self._configure.make_communicator( resname )
+            job             = getattr( self._managers[ resname ], 'Job' ) ()
+            # SUBMIT fills in per job features (host, queue, ...)
+            job.resfeatures = dict( resdict )
+            return job, self._communicators[ resname ]
 
 import sys
 import traceback
@@ -19,8 +19,15 @@
 #
 
 import sys
+import time
 import logging
+import threading
+from collections           import deque
+from os.path               import join
+from drm4g                 import DRM4G_DIR_VAR
 from drm4g.core.configure  import Configuration
+from drm4g.utils.cache     import HostCache
+from drm4g.utils.dynamic   import ThreadPool
 from drm4g.utils.message   import Send
 
 
@@ -60,6 +67,21 @@ class GwImMad (object):
     def __init__(self):
         self._resources  = dict()
         self._config     = None
+        self._discover_timeout = 10 #seconds, to wait for the hosts of the resources
+        self._discovered  = dict()
+        self._discovering = dict()
+        self._lock        = threading.Lock()
+        self._cache_file  = join( DRM4G_DIR_VAR, 'im_hosts.db' )
+        self._cache       = None
+        self._communicators         = dict()
+        self._communicator_idle     = 600 #seconds, idle communicators are closed
+        self._communicator_check    = 60  #seconds, idle time before checking a communicator
+        self._max_thread     = 10
+        self._min_thread     = 3
+        self._pool           = None
+        self._resource_tasks = dict()
+        self._tasks_lock     = threading.Lock()
+        self._resource_locks = dict() # resname -> Lock held while its Resource is in use
 
     def do_INIT(self, args):
         """
@@ -79,26 +101,27 @@ class GwImMad (object):
         """
         OPERATION, HID, HOST, ARGS = args.split()
         try:
-            self._config  = Configuration()
-            self._config.load()
-            errors        = self._config.check()
+            config = Configuration()
+            config.load()
+            errors = config.check()
             assert not errors, ' '.join( errors )
 
-            self._resources  = self._config.make_resources()
-            communicators    = self._config.make_communicators()
-            hosts = ""
+            resources = self._update_resources( config )
+            with self._lock :
+                self._config    = config
+                self._resources = resources
+            self._expire_communicators()
+            resnames = []
             for resname in sorted( self._resources.keys() ) :
                 if  self._config.resources[ resname ][ 'enable' ].lower()  == 'false' :
                     continue
                 if  'cloud_provider' in self._config.resources[ resname ].keys():
                     continue
-                try :
-                    self._resources[ resname ][ 'Resource' ].Communicator = communicators[ resname ]
-                    self._resources[ resname ][ 'Resource' ].Communicator.connect()
-                    hosts = hosts + " " + self._resources[ resname ] [ 'Resource' ].hosts()
-                    self._resources[ resname ][ 'Resource' ].Communicator.close()
-                except Exception as err :
-                    self.logger.error( err , exc_info=1 )
+                if  not self._resources[ resname ] :
+                    continue
+                self._resources[ resname ][ 'Resource' ].cache        = self._cache
+                resnames.append( resname )
+            hosts = self._discover_hosts( resnames )
             out = 'DISCOVER %s SUCCESS %s' % ( HID , hosts  )
         except Exception as err :
             out = 'DISCOVER - FAILURE %s' % str( err )
@@ -107,6 +130,153 @@ class GwImMad (object):
             self.message.stdout( out )
         self.logger.debug( out )
 
+    def _update_resources(self, config):
+        """
+        Compare the resources of config with the ones of the previous
+        DISCOVER and only make the objects of resources added or edited;
+        the others are kept as they are.
+        @param config : new configuration
+        @type config : Configuration
+        @return: mapping of resource names to their 'Resource' and 'Job' objects
+        @rtype: dict
+        """
+        previous  = self._config.resources if self._config else dict()
+        resources = dict()
+        for resname, resdict in list( config.resources.items() ) :
+            if resdict == previous.get( resname ) and self._resources.get( resname ) :
+                resources[ resname ] = self._resources[ resname ]
+                continue
+            self.logger.debug( "Making objects for resource '%s'" % resname )
+            try :
+                resources[ resname ] = config.make_resource( resname )
+            except Exception as err :
+                resources[ resname ] = dict()
+                self.logger.warning( "Failed creating objects for resource '%s' : %s" % ( resname, str( err ) ), exc_info=1 )
+        return resources
+
+    def _discover_hosts(self, resnames):
+        """
+        Discover the hosts of several resources in parallel. Resources that
+        do not answer within _discover_timeout seconds keep on being
+        discovered in the background and their hosts are reported by the
+        next DISCOVER.
+        @param resnames : names of the resources
+        @type resnames : list
+        @return: discovered hosts separated by spaces
+        @rtype: string
+        """
+        threads = []
+        for resname in resnames :
+            resource = self._resources[ resname ][ 'Resource' ]
+            with self._lock :
+                thread = self._discovering.get( resname )
+                if not thread :
+                    thread = threading.Thread( target = self._discover_resource, args = ( resname, resource ) )
+                    thread.daemon = True
+                    self._discovering[ resname ] = thread
+                    thread.start()
+            threads.append( thread )
+        deadline = time.time() + self._discover_timeout
+        for thread in threads :
+            thread.join( max( deadline - time.time(), 0 ) )
+        hosts = ""
+        with self._lock :
+            for resname in resnames :
+                if resname in self._discovered :
+                    host_list = self._discovered[ resname ]
+                    self._resources[ resname ][ 'Resource' ].host_list = host_list
+                    hosts = hosts + " " + ' '.join( host_list )
+                elif resname in self._discovering :
+                    self.logger.warning( "Resource '%s' is still being discovered" % resname )
+        return hosts
+
+    def _resource_lock(self, resname):
+        with self._lock :
+            return self._resource_locks.setdefault( resname, threading.Lock() )
+
+    def _discover_resource(self, resname, resource):
+        try :
+            with self._resource_lock( resname ) :
+                resource.Communicator = self._get_communicator( resname )
+                resource.hosts()
+                host_list = list( resource.host_list )
+            with self._lock :
+                self._discovered[ resname ] = host_list
+        except Exception as err :
+            with self._lock :
+                self._discovered.pop( resname, None )
+            self.logger.error( err , exc_info=1 )
+        finally :
+            with self._lock :
+                self._discovering.pop( resname, None )
+
+    def _get_communicator(self, resname):
+        """
+        Return a connected communicator of the resource. Communicators are
+        kept open between calls and reused while the configuration of the
+        resource does not change; those idle for more than
+        _communicator_check seconds are checked before being reused.
+        """
+        with self._lock :
+            resdict = self._config.resources.get( resname )
+            entry   = self._communicators.get( resname )
+        if not resdict :
+            raise Exception( "Resource '%s' is not configured" % resname )
+        if entry and entry[ 'resdict' ] != resdict :
+            self._close_communicator( resname, entry )
+            entry = None
+        elif entry and time.time() - entry[ 'last_used' ] > self._communicator_check :
+            if not self._is_alive( entry[ 'communicator' ] ) :
+                self.logger.warning( "Connection to resource '%s' is broken, opening a new one" % resname )
+                self._close_communicator( resname, entry )
+                entry = None
+        if not entry :
+            communicator = self._config.make_communicator( resname )
+            communicator.connect()
+            entry = dict( communicator = communicator, resdict = dict( resdict ) )
+            with self._lock :
+                self._communicators[ resname ] = entry
+        entry[ 'last_used' ] = time.time()
+        return entry[ 'communicator' ]
+
+    def _is_alive(self, communicator):
+        """
+        Check the connection with a trivial command. Some communicators
+        return bytes, and None when the command could not be run, which
+        counts as a broken connection.
+        """
+        try :
+            result = communicator.execCommand( 'echo DRM4G' )
+        except Exception :
+            return False
+        if not result or result[ 0 ] is None :
+            return False
+        out = result[ 0 ]
+        if isinstance( out, bytes ) :
+            out = out.decode( 'utf-8', 'replace' )
+        return 'DRM4G' in out
+
+    def _close_communicator(self, resname, entry):
+        with self._lock :
+            if self._communicators.get( resname ) is entry :
+                del self._communicators[ resname ]
+        try :
+            entry[ 'communicator' ].close()
+        except Exception as err :
+            self.logger.warning( "Could not close the communicator of '%s': %s" % ( resname, str( err ) ) )
+
+    def _expire_communicators(self):
+        """
+        Close the communicators not used for _communicator_idle seconds and
+        those of resources no longer configured.
+        """
+        with self._lock :
+            entries = list( self._communicators.items() )
+        for resname, entry in entries :
+            if ( resname not in self._config.resources or
+                 time.time() - entry[ 'last_used' ] > self._communicator_idle ) :
+                self._close_communicator( resname, entry )
+
     def do_MONITOR(self, args, output=True):
         """
         Monitors a host (i.e. MONITOR HID HOST -)
@@ -116,12 +286,17 @@ class GwImMad (object):
         OPERATION, HID, HOST, ARGS = args.split()
         try:
             info = ""
-            for resname, resdict in list(self._resources.items()) :
-                if self._config.resources[ resname ][ 'enable' ].lower() == 'false':
+            # DISCOVER replaces both at once
+            with self._lock :
+                config, resources = self._config, self._resources
+            for resname, resdict in list(resources.items()) :
+                if config.resources[ resname ][ 'enable' ].lower() == 'false':
                     raise Exception( "Resource '%s' is not enable" % resname )
                 if HOST in resdict['Resource'].host_list :
-                    info = resdict['Resource'].host_properties( HOST )
-                    resdict['Resource'].Communicator.close()
+                    # Background discoveries use the same Resource object
+                    with self._resource_lock( resname ) :
+                        resdict['Resource'].Communicator = self._get_communicator( resname )
+                        info = resdict['Resource'].host_properties( HOST )
                     break
             assert info, "Host '%s' is not available" % HOST
             out = 'MONITOR %s SUCCESS %s' % (HID , info )
@@ -138,6 +313,8 @@ class GwImMad (object):
         @param args : arguments of operation
         @type args : string
         """
+        for resname, entry in list( self._communicators.items() ) :
+            self._close_communicator( resname, entry )
         out = 'FINALIZE - SUCCESS -'
         self.message.stdout(out)
         self.logger.debug(out)
@@ -154,12 +331,20 @@ class GwImMad (object):
         Choose the OPERATION through the command line
         """
         try:
+            try:
+                self._cache = HostCache( self._cache_file )
+            except Exception as err:
+                self.logger.warning( "Could not open the host cache '%s': %s" % ( self._cache_file, str( err ) ) )
+            self._pool = ThreadPool( self._min_thread, self._max_thread )
             while True:
                 input = sys.stdin.readline().split()
                 self.logger.debug(' '.join(input))
                 if len(input)>0:
                     OPERATION = input[0].upper()
-                    if len(input) == 4 and OPERATION in self.methods:
+                    if len(input) == 4 and OPERATION == 'MONITOR':
+                        resname = input[2].split( '::' )[0]
+                        self._dispatch( resname, self.methods[OPERATION], ' '.join(input) )
+                    elif len(input) == 4 and OPERATION in self.methods:
                         self.methods[OPERATION](self, ' '.join(input))
                     else:
                         out = 'WRONG COMMAND'
@@ -168,6 +353,32 @@ class GwImMad (object):
         except Exception as err:
             self.logger.warning( str ( err ) , exc_info=1 )
 
+    def _dispatch(self, resname, method, args):
+        """
+        Run an operation in the thread pool. Hosts of different resources
+        are monitored concurrently, while the operations on the same
+        resource are run one after another in the order they were received.
+        """
+        with self._tasks_lock :
+            if resname in self._resource_tasks :
+                self._resource_tasks[ resname ].append( ( method, args ) )
+                return
+            self._resource_tasks[ resname ] = deque()
+        self._pool.add_task( self._run_resource_tasks, resname, method, args )
+
+    def _run_resource_tasks(self, resname, method, args):
+        while True:
+            try:
+                method( self, args )
+            except Exception as err:
+                self.logger.error( err , exc_info=1 )
+            with self._tasks_lock :
+                if self._resource_tasks[ resname ] :
+                    method, args = self._resource_tasks[ resname ].popleft()
+                else :
+                    del self._resource_tasks[ resname ]
+                    return
+
 import sys
 import traceback
 from argparse import ArgumentParser,SUPPRESS
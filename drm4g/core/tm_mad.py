@@ -18,11 +18,15 @@
 # permissions and limitations under the Licence.
 #
 
+import os
 import sys
+import select
+import asyncio
 import logging
 import threading
 from drm4g.utils.url       import urlparse
 from drm4g.utils.dynamic   import ThreadPool
+from drm4g.utils.aio       import get_event_loop
 from drm4g.core.configure  import Configuration
 from drm4g.utils.message   import Send
 
@@ -82,6 +86,13 @@ class GwTmMad (object):
         self._lock         = threading.Lock()
         self._communicator = dict()
         self._configure    = None
+        self._pool         = None
+        self._loop         = None
+        self._cp_window    = 0.5 #seconds, time to gather the CP requests of a job
+        self._transfers    = dict()
+        self._transfers_lock = threading.Lock()
+        self._stdin_fd     = None
+        self._input        = b''
 
     def do_INIT(self, args):
         """
@@ -125,17 +136,19 @@ class GwTmMad (object):
         self.logger.debug( out )
         sys.exit( 0 )
 
-    def do_MKDIR(self, args):
+    async def do_MKDIR(self, args):
         """
         MKDIR: Creates directory SRC_URL (i.e. MKDIR JID - - SRC_URL -)
+        Coroutine run in the event loop of the MAD.
         @param args : arguments of operation
         @type args : string
         """
         OPERATION, JID, TID, EXE_MODE, SRC_URL, DST_URL = args.split()
+        loop = asyncio.get_event_loop()
         try:
-            com = self._update_com( urlparse( SRC_URL ).host )
-            com.rmDirectory( SRC_URL )
-            com.mkDirectory( SRC_URL )
+            com = await loop.run_in_executor( None, self._update_com, urlparse( SRC_URL ).host )
+            await com.rmDirectoryAsync( SRC_URL )
+            await com.mkDirectoryAsync( SRC_URL )
             out = 'MKDIR %s - SUCCESS -' % ( JID )
         except Exception as err :
             out = 'MKDIR %s - FAILURE %s' % ( JID , str( err ) )
@@ -143,17 +156,19 @@ class GwTmMad (object):
         self.message.stdout( out )
         self.logger.debug( out )
 
-    def do_RMDIR(self, args):
+    async def do_RMDIR(self, args):
         """
         RMDIR: Removes directory SRC_URL (i.e. RMDIR JID - - SRC_URL -)
+        Coroutine run in the event loop of the MAD.
         @param args : arguments of operation
         @type args : string
         """
         OPERATION, JID, TID, EXE_MODE, SRC_URL, DST_URL = args.split()
+        loop = asyncio.get_event_loop()
         try:
-            com = self._update_com( urlparse( SRC_URL ).host )
-            if not com.checkoutLock(SRC_URL):
-                com.rmDirectory(SRC_URL)
+            com = await loop.run_in_executor( None, self._update_com, urlparse( SRC_URL ).host )
+            if not await loop.run_in_executor( None, com.checkoutLock, SRC_URL ):
+                await com.rmDirectoryAsync(SRC_URL)
                 out = 'RMDIR %s - SUCCESS -' % (JID)
             else:
                 out = 'RMDIR %s - FAILURE Directory "%s" is locked' % (JID, SRC_URL)
@@ -185,6 +200,88 @@ class GwTmMad (object):
         self.message.stdout( out )
         self.logger.debug(out)
 
+    def _add_transfer(self, args):
+        """
+        Keep a CP request, up to _cp_window seconds, so the ones of the same
+        job and host arriving meanwhile are copied together. processLine
+        flushes them as soon as no more requests are waiting.
+        """
+        OPERATION, JID, TID, EXE_MODE, SRC_URL, DST_URL = args.split()
+        if 'file:' in SRC_URL:
+            url = DST_URL
+        else:
+            url = SRC_URL
+        key = ( JID, urlparse( url ).host )
+        with self._transfers_lock :
+            if key in self._transfers :
+                self._transfers[ key ].append( args )
+                return
+            self._transfers[ key ] = [ args ]
+        timer = threading.Timer( self._cp_window, self._flush_transfers, ( key, ) )
+        timer.daemon = True
+        timer.start()
+
+    def _flush_transfers(self, key):
+        with self._transfers_lock :
+            transfers = self._transfers.pop( key, None )
+        if not transfers :
+            return
+        if len( transfers ) == 1 :
+            self._pool.add_task( self.do_CP, transfers[ 0 ] )
+        else :
+            self._pool.add_task( self._copy_files, key[ 1 ], transfers )
+
+    def _flush_all_transfers(self):
+        with self._transfers_lock :
+            keys = list( self._transfers.keys() )
+        for key in keys :
+            self._flush_transfers( key )
+
+    def _read_request(self):
+        """
+        Read a request line from the standard input, '' at the end of it.
+        The input is buffered here so _input_pending can tell whether more
+        requests are already waiting.
+        """
+        while b'\n' not in self._input :
+            data = os.read( self._stdin_fd, 65536 )
+            if not data :
+                line, self._input = self._input, b''
+                return line.decode()
+            self._input += data
+        line, self._input = self._input.split( b'\n', 1 )
+        return line.decode()
+
+    def _input_pending(self):
+        if b'\n' in self._input :
+            return True
+        try :
+            return bool( select.select( [ self._stdin_fd ], [], [], 0 )[ 0 ] )
+        except ( OSError, ValueError ) :
+            return False
+
+    def _copy_files(self, host, transfers):
+        """
+        Copy the files of several CP requests of the same job and host with
+        a single call to the communicator, answering each TID on its own.
+        """
+        requests = [ args.split() for args in transfers ]
+        try:
+            com    = self._update_com( host )
+            errors = com.copyFiles( [ ( SRC_URL, DST_URL, EXE_MODE )
+                                      for _, _, _, EXE_MODE, SRC_URL, DST_URL in requests ] )
+        except Exception as err :
+            self.logger.error( err , exc_info=1 )
+            errors = [ str( err ) ] * len( requests )
+        for ( OPERATION, JID, TID, EXE_MODE, SRC_URL, DST_URL ), error in zip( requests, errors ) :
+            if error :
+                out = 'CP %s %s FAILURE %s' % ( JID , TID , error )
+                self.logger.error( out )
+            else :
+                out = 'CP %s %s SUCCESS -' % ( JID , TID )
+            self.message.stdout( out )
+            self.logger.debug( out )
+
     methods = {'INIT'    : do_INIT,
                'START'   : do_START,
                'END'     : do_END,
@@ -198,57 +295,67 @@ class GwTmMad (object):
         Choose the OPERATION through the command line
         """
         try:
-            pool = ThreadPool( self._min_thread , self._max_thread )
+            self._pool = ThreadPool( self._min_thread , self._max_thread )
+            self._loop = get_event_loop()
             self._configure = Configuration()
+            if self._stdin_fd is None :
+                self._stdin_fd = sys.stdin.fileno()
             while True:
-                input = sys.stdin.readline().split()
+                input = self._read_request().split()
                 self.logger.debug(' '.join(input))
                 OPERATION = input[0].upper()
                 if len(input) == 6 and OPERATION in self.methods:
                     if OPERATION == 'FINALIZE' or OPERATION == 'INIT':
                         self.methods[OPERATION](self, ' '.join(input))
-                    else: pool.add_task(self.methods[OPERATION], self,' '.join(input))
+                    elif OPERATION == 'CP':
+                        self._add_transfer(' '.join(input))
+                    elif OPERATION == 'MKDIR' or OPERATION == 'RMDIR':
+                        self._loop.submit(self.methods[OPERATION](self, ' '.join(input)))
+                    else: self._pool.add_task(self.methods[OPERATION], self,' '.join(input))
                 else:
                     out = 'WRONG COMMAND'
                     self.message.stdout(out)
                     self.logger.debug(out)
+                if self._transfers and not self._input_pending():
+                    # no more requests to gather, a lone CP is not delayed
+                    self._flush_all_transfers()
         except Exception as err :
             self.logger.warning( str ( err ) , exc_info=1 )
 
     def _update_com(self, host):
+        """
+        Return the communicator of the resource used by host. Communicators
+        are cached per resource and the configuration is only reloaded when
+        the file changes.
+        """
+        if '::' in host :
+            resname , _ = host.split( '::' )
+        else :
+            resname = host
         with self._lock :
-            self.logger.debug( "_update_com function - It's looking for a communicator for the host: %s" % host )
             if not self._configure:
                 self._configure = Configuration()
-            '''
             if self._configure.check_update() or not self._configure.resources :
+                old_resources = self._configure.resources
+                self._configure.resources = dict()
                 self._configure.load()
                 errors = self._configure.check()
                 if errors :
+                    self._configure.resources = old_resources
                     self.logger.error ( ' '.join( errors ) )
                     raise Exception ( ' '.join( errors ) )
-            '''
-            #This needs to be optimized
-            self._configure.load()
-            errors = self._configure.check()
-            if errors :
-                self.logger.error ( ' '.join( errors ) )
-                raise Exception ( ' '.join( errors ) )
-            for resname, resdict in list(self._configure.resources.items()) :
-                self.logger.debug( "    The current resource to which it's being compared is %s" % resname )
-                if 'cloud_provider' in self._configure.resources[ resname ].keys():
-                    continue
-                elif '::' in host :
-                    _resname , _ = host.split( '::' )
-                    if resname != _resname :
-                        continue
-                elif resname != host :
-                    continue
-                elif resname not in self._communicator:
-                    self.logger.debug( "    Since they are the same, its Communicator() will be returned")
-                    self._communicator[ resname ] = self._configure.make_communicators()[resname]
-                self.logger.debug( "\nCommunicator for %s:\n    communicator: %s\n    username: %s\n    frontend: %s" % (resname, resdict[ 'communicator' ], self._communicator[ resname ].username, self._communicator[ resname ].frontend) )
-                return self._communicator[ resname ]
+                for name in list( self._communicator.keys() ) :
+                    if old_resources.get( name ) != self._configure.resources.get( name ) :
+                        del self._communicator[ name ]
+            resdict = self._configure.resources.get( resname )
+            if not resdict or 'cloud_provider' in resdict :
+                raise Exception( "Resource '%s' is not configured" % resname )
+            if resname not in self._communicator :
+                self._communicator[ resname ] = self._configure.make_communicator( resname )
+                self.logger.debug( "Communicator for %s: communicator: %s, username: %s, frontend: %s" % (
+                                   resname, resdict[ 'communicator' ], self._communicator[ resname ].username,
+                                   self._communicator[ resname ].frontend ) )
+            return self._communicator[ resname ]
 
 import sys
 import traceback
@@ -19,16 +19,24 @@
 #
 
 import sys
+import time
 import xml.dom.minidom
 import os
 import subprocess
 import pickle
+import shlex
+import asyncio
 import threading
 
 import logging
 logger  = logging.getLogger(__name__)
 
 
+# Printed after the bulk status command to tell a complete answer from a failed one
+JOBS_STATUS_END = 'DRM4G_JOBS_STATUS_END'
+# Printed by jobStageSubmit once the wrapper is written on the remote host
+WRAPPER_STAGED = 'DRM4G_WRAPPER_STAGED'
+
 def totalCores( cores ):
     return sum( [ int( core ) for core in cores.split( ',' ) ] )
 
@@ -40,6 +48,15 @@ def sec_to_H_M_S( sec ):
     h, m = divmod( m, 60 )
     return "%d:%02d:%02d" % ( h, m, s )
 
+def H_M_S_to_sec( time_value ):
+    """
+    Convert [[HH:]MM:]SS into seconds
+    """
+    sec = 0
+    for field in str( time_value ).strip().split( ':' ) :
+        sec = sec * 60 + int( float( field ) )
+    return sec
+
 class ResourceException(Exception):
     pass
 
@@ -51,11 +68,17 @@ class Resource (object):
     Class to obtain information about compute resources
     """
 
+    # Time to live of the cached host information
+    static_ttl  = 24 * 3600 #seconds, OS and architecture
+    dynamic_ttl = 600       #seconds, queue properties
+    metrics_ttl = 15        #seconds, live queue metrics, about a monitoring cycle
+
     def __init__(self):
         self.name           = None
         self.features       = dict()
         self.Communicator   = None
         self.host_list      = []
+        self.cache          = None
 
     def hosts(self):
         """
@@ -76,7 +99,6 @@ class Resource (object):
         """
         host_info       = HostInformation()
         host_info.Name  = host
-        host_info.Name, host_info.OsVersion, host_info.Arch, host_info.Os = self.system_information()
 
         q_features = [ ( q_elem.strip(), jobr_elem.strip(), jobq_elem.strip() )
                       for q_elem, jobr_elem, jobq_elem in zip(
@@ -84,36 +106,130 @@ class Resource (object):
                                                   self.features[ 'max_jobs_running' ].split( ',' ) ,
                                                   self.features[ 'max_jobs_in_queue' ].split( ',' )
                                                   ) ]
+        queues = []
         for queue_name, max_jobs_running, max_jobs_in_queue in q_features  :
             queue                = Queue()
             queue.Name           = queue_name
             queue.MaxRunningJobs = max_jobs_running
             queue.MaxJobsInQueue = max_jobs_in_queue
-            host_info.addQueue( self.additional_queue_properties( queue ) )
+            queues.append( queue )
+
+        # Information not cached is obtained with a single remote command
+        system_key = '%s:%s:system' % ( self.name, host )
+        system     = self.cache.get( system_key ) if self.cache else None
+        commands   = []
+        if not system :
+            commands.append( ( 'system', self.system_information_command() ) )
+        pending = []
+        for index, queue in enumerate( queues ) :
+            queue_key  = '%s:%s:queue:%s:%s:%s' % ( self.name, host, queue.Name, queue.MaxRunningJobs, queue.MaxJobsInQueue )
+            properties = self.cache.get( queue_key ) if self.cache else None
+            if properties :
+                queue.__dict__.update( properties )
+                continue
+            command = self.additional_queue_command( queue )
+            if command :
+                commands.append( ( 'queue%d' % index, command ) )
+            pending.append( ( index, queue_key, command ) )
+        metrics_key = '%s:%s:metrics' % ( self.name, host )
+        metrics     = self.cache.get( metrics_key ) if self.cache else None
+        metrics_command = None if metrics is not None else self.queue_metrics_command()
+        if metrics_command :
+            commands.append( ( 'metrics', metrics_command ) )
+        results = self.probe( commands )
+        if not system :
+            system = self.system_information_result( *results[ 'system' ] )
+            if self.cache and 'NULL' not in system :
+                self.cache.put( system_key, list( system ), self.static_ttl )
+        for index, queue_key, command in pending :
+            if command :
+                queues[ index ] = self.additional_queue_result( queues[ index ], *results[ 'queue%d' % index ] )
+            if self.cache :
+                self.cache.put( queue_key, queues[ index ].__dict__, self.dynamic_ttl )
+        if metrics_command :
+            metrics = self.queue_metrics_result( *results[ 'metrics' ] )
+            if self.cache and metrics :
+                self.cache.put( metrics_key, metrics, self.metrics_ttl )
+        for queue in queues :
+            queue.__dict__.update( ( metrics or dict() ).get( queue.Name, dict() ) )
+
+        host_info.Name, host_info.OsVersion, host_info.Arch, host_info.Os = system
+        for queue in queues :
+            host_info.addQueue( queue )
  #       host_info.addQueue( Queue() )
         host_info.LrmsName = self.features[ 'lrms' ]
         host_info.LrmsType = self.features[ 'lrms' ]
         return host_info.info()
 
+    def probe(self, commands ):
+        """
+        Run several commands on the frontend with a single remote execution.
+        @param commands : (name, command) tuples
+        @type commands : list
+        @return: mapping of each name to the (stdout, stderr) of its command
+        @rtype: dict
+        """
+        results = dict()
+        if not commands :
+            return results
+        outputs = self.Communicator.execBatch( [ command for _, command in commands ] )
+        for ( name, _ ), ( out, err, _ ) in zip( commands, outputs ) :
+            results[ name ] = ( out, err )
+        return results
+
     def system_information(self):
         """
         It will return a tuple with hostname, OS version, architecture, OS name
         """
-        out, err = self.Communicator.execCommand('uname -n -r -m -o')
+        out, err = self.Communicator.execCommand( self.system_information_command() )
+        return self.system_information_result( out, err )
+
+    def system_information_command(self):
+        return 'uname -n -r -m -o'
+
+    def system_information_result(self, out, err):
         if not err:
             return out.split()
         else:
             logger.error("Error executing `uname` command: %s" % ' '.join( err.split( '\n' ) ) )
             return ('NULL', 'NULL', 'NULL', 'NULL')
 
+    def additional_queue_properties(self, queue):
+        command = self.additional_queue_command( queue )
+        if not command :
+            return queue
+        out, err = self.Communicator.execCommand( command )
+        return self.additional_queue_result( queue, out, err )
+
     # To overload
-    def additional_queue_properties(self, Queue):
-        return Queue
+    def additional_queue_command(self, queue):
+        pass
+
+    def additional_queue_result(self, queue, out, err):
+        return queue
+
+    def queue_metrics_command(self):
+        """
+        Command reporting the current load of every queue of the host.
+        """
+        pass
+
+    def queue_metrics_result(self, out, err):
+        """
+        @return: mapping of queue names to the Queue attributes to update,
+            e.g. Nodes, FreeNodes, Status, RunningJobs and QueuedJobs
+        @rtype: dict
+        """
+        return dict()
 
 class Job (object):
     """
     Class to manage jobs
     """
+    # Absolute remote directories already resolved, shared by all the jobs
+    abs_directory_ttl = 3600 #seconds
+    _abs_directories  = dict()
+    _abs_lock         = threading.Lock()
 
     def __init__(self):
         self.resfeatures  = dict()
@@ -135,14 +251,32 @@ class Job (object):
             self._status = self.jobStatus()
 
     def get_abs_directory(self, directory ):
+        key = ( self.Communicator.username, self.Communicator.frontend, directory )
+        with self._abs_lock :
+            abs_directory, expiration = Job._abs_directories.get( key, ( None, 0 ) )
+        if abs_directory and expiration > time.time() :
+            return abs_directory
         out, err = self.Communicator.execCommand( 'ls -d %s' % directory )
         if not err:
-            return out.strip('\n')
+            abs_directory = out.strip('\n')
+            with self._abs_lock :
+                Job._abs_directories[ key ] = ( abs_directory, time.time() + self.abs_directory_ttl )
+            return abs_directory
         else:
+            self.invalidate_abs_directory( directory )
             output = "Could not obtain  the '%s' directory : %s" % ( directory , str ( err ) )
             logger.error( output )
             raise JobException( output )
 
+    def invalidate_abs_directory(self, directory ):
+        """
+        Forget the absolute path resolved for directory, e.g. after a failure
+        using it.
+        """
+        key = ( self.Communicator.username, self.Communicator.frontend, directory )
+        with self._abs_lock :
+            Job._abs_directories.pop( key, None )
+
     def createWrapper(self, local_directory, template):
         try:
             f = open(local_directory, 'w')
@@ -163,19 +297,164 @@ class Job (object):
         except Exception as e:
             raise JobException("Error copying wrapper_drm4g : %s" % str(e) )
 
-    # To overload
     def jobSubmit( self , wrapper_dir ) :
+        out, err = self.Communicator.execCommand( self.jobSubmitCommand( wrapper_dir ) )
+        return self.jobSubmitResult( out, err )
+
+    def jobStageSubmit( self , local_directory , remote_directory , template ) :
+        """
+        Write wrapper_drm4g on the remote host, give it execute permissions
+        and submit it, all of it with a single remote command. Managers
+        without a jobSubmitCommand copy the wrapper and submit it apart.
+
+        The command runs under `sh -c`, written without line breaks, so it
+        does not depend on the login shell of the user. If the wrapper could
+        not be written that way, it is copied and submitted apart as well.
+        """
+        submit_command = self.jobSubmitCommand( remote_directory )
+        if not submit_command :
+            self.copyWrapper( local_directory, remote_directory )
+            return self.jobSubmit( remote_directory )
+        lines   = template[ : -1 ].split( '\n' ) if template.endswith( '\n' ) else template.split( '\n' )
+        script  = "printf '%%s\\n' %s > %s && chmod +x %s && echo %s && %s" % (
+                   ' '.join( shlex.quote( line ) for line in lines ) , remote_directory , remote_directory ,
+                   WRAPPER_STAGED , submit_command )
+        try :
+            out, err = self.Communicator.execCommand( 'sh -c %s' % shlex.quote( script ) )
+        except Exception as error :
+            out, err = None, str( error )
+        if isinstance( out , bytes ) :
+            out = out.decode( 'utf-8' , 'replace' )
+            err = err.decode( 'utf-8' , 'replace' )
+        if not out or WRAPPER_STAGED not in out :
+            logger.warning( "Could not write the wrapper in one command, copying it: %s" % ( err or '' ).strip( ) )
+            self.copyWrapper( local_directory, remote_directory )
+            return self.jobSubmit( remote_directory )
+        return self.jobSubmitResult( out[ out.index( WRAPPER_STAGED ) + len( WRAPPER_STAGED ) : ].lstrip( '\n' ) , err )
+
+    # To overload
+    def jobSubmitCommand( self , wrapper_dir ) :
+        pass
+
+    def jobSubmitResult( self , out , err ) :
         pass
 
     def jobStatus( self ) :
         pass
 
+    @classmethod
+    def jobsStatus( cls , communicator , job_ids ) :
+        """
+        Obtain the status of several jobs of the same resource at once.
+
+        Managers able to query their LRMS about many jobs with a single
+        command should overload jobsStatusCommand and jobsStatusResult.
+
+        @param communicator : communicator of the resource
+        @type communicator : Communicator
+        @param job_ids : LRMS job identifiers
+        @type job_ids : list of string
+        @return: mapping of job identifiers to GridWay job status. Jobs
+            not included have to be refreshed one by one with jobStatus.
+        @rtype: dict
+        """
+        command = cls.jobsStatusCommand( job_ids )
+        if not command :
+            return dict()
+        out, err = communicator.execCommand( '%s\necho %s' % ( command , JOBS_STATUS_END ) )
+        return cls._jobsStatusOutput( job_ids , out , err )
+
+    @classmethod
+    async def jobsStatusAsync( cls , communicator , job_ids ) :
+        """
+        Coroutine obtaining the status of several jobs, as jobsStatus, to
+        be awaited in an asyncio event loop (see drm4g.utils.aio).
+        Managers overloading jobsStatus itself run it in the default
+        executor of the loop.
+        """
+        command = cls.jobsStatusCommand( job_ids )
+        if cls.jobsStatus.__func__ is not Job.jobsStatus.__func__ :
+            loop = asyncio.get_event_loop()
+            return await loop.run_in_executor( None , cls.jobsStatus , communicator , job_ids )
+        if not command :
+            return dict()
+        out, err = await communicator.execCommandAsync( '%s\necho %s' % ( command , JOBS_STATUS_END ) )
+        return cls._jobsStatusOutput( job_ids , out , err )
+
+    @classmethod
+    def _jobsStatusOutput( cls , job_ids , out , err ) :
+        """
+        Parse the output of the bulk status command, unless it did not run
+        to the end. Otherwise, a broken connection or an empty answer would
+        report every job as finished.
+        """
+        if isinstance( out , bytes ) :
+            out, err = out.decode( 'utf-8' , 'replace' ) , err.decode( 'utf-8' , 'replace' )
+        if not out or JOBS_STATUS_END not in out :
+            logger.warning( "The status query of %d jobs did not finish: %s" % ( len( job_ids ) , err ) )
+            return dict()
+        return cls.jobsStatusResult( job_ids , out[ : out.rindex( JOBS_STATUS_END ) ] , err )
+
+    # To overload
+    @classmethod
+    def jobsStatusCommand( cls , job_ids ) :
+        return None
+
+    @classmethod
+    def jobsStatusResult( cls , job_ids , out , err ) :
+        """
+        Jobs missing from out may only be reported as finished when the
+        query did not fail, otherwise return an empty dict.
+        """
+        return dict()
+
     def jobCancel( self ) :
         pass
 
     def jobTemplate( self , rsl ) :
         pass
 
+    # To overload by managers supporting LRMS job arrays
+    array_directive = None # directive requesting the array, e.g. '#SBATCH --array=1-%d'
+    array_index     = None # variable holding the index of each array task
+
+    def jobArrayName( self , array_id , tasks ) :
+        return 'A%s' % array_id
+
+    def jobArrayTaskId( self , array_job_id , index ) :
+        pass
+
+    def jobArrayTemplate( self , rsl_list ) :
+        """
+        Build a single LRMS script running a task of an array for each
+        rsl in rsl_list. The task with index i (starting at 1) runs the
+        executable of rsl_list[i-1] with its own environment, stdout and
+        stderr.
+
+        @param rsl_list : rsl of the tasks, all of them with the same
+            requirements
+        @type rsl_list : list of dict
+        @return: LRMS script
+        @rtype: string
+        """
+        parameters = dict( rsl_list[ 0 ] )
+        array_id   = parameters[ 'environment' ].get( 'GW_ARRAY_ID' )
+        cases = [ 'case $%s in' % self.array_index ]
+        for index, rsl in enumerate( rsl_list, 1 ) :
+            exports = ''.join( [ 'export %s=%s; ' % ( k, v ) for k, v in list( rsl[ 'environment' ].items() ) ] )
+            cases.append( '%d) ( %sexec %s ) > %s 2> %s ;;' % ( index, exports, rsl[ 'executable' ], rsl[ 'stdout' ], rsl[ 'stderr' ] ) )
+        cases.append( 'esac' )
+        parameters[ 'environment' ] = { 'GW_JOB_ID' : self.jobArrayName( array_id, len( rsl_list ) ) ,
+                                        'GW_ARRAY_ID' : array_id }
+        parameters[ 'stdout' ]      = '/dev/null'
+        parameters[ 'stderr' ]      = '/dev/null'
+        parameters[ 'executable' ]  = '\n'.join( cases )
+        template = self.jobTemplate( parameters )
+        if self.array_directive :
+            shebang, directives = template.split( '\n', 1 )
+            template = '%s\n%s\n%s' % ( shebang, self.array_directive % len( rsl_list ), directives )
+        return template
+
 class Queue( object ) :
 
     def __init__(self):
@@ -190,6 +469,8 @@ class Queue( object ) :
         self.Status         = "NULL"
         self.DispatchType   = "NULL"
         self.Priority       = "NULL"
+        self.RunningJobs    = None
+        self.QueuedJobs     = None
 
     def info (self, i):
         """
@@ -197,12 +478,18 @@ class Queue( object ) :
         @rtype: string
         """
         i = str(i)
-        return  'QUEUE_NAME[' + i + ']="' + self.Name + '" QUEUE_NODECOUNT[' + i + ']=' + self.Nodes + \
+        info = 'QUEUE_NAME[' + i + ']="' + self.Name + '" QUEUE_NODECOUNT[' + i + ']=' + self.Nodes + \
             ' QUEUE_FREENODECOUNT[' + i + ']=' + self.FreeNodes + ' QUEUE_MAXTIME[' + i +']=' + self.MaxTime + \
             ' QUEUE_MAXCPUTIME[' + i + ']=' + self.MaxCpuTime + ' QUEUE_MAXCOUNT[' + i + ']=' + self.MaxCount + \
             ' QUEUE_MAXRUNNINGJOBS[' + i + ']=' + self.MaxRunningJobs + ' QUEUE_MAXJOBSINQUEUE[' + i + ']=' + \
             self.MaxJobsInQueue  + ' QUEUE_STATUS[' + i + ']="' + self.Status + '" QUEUE_DISPATCHTYPE[' + i + ']="'+ \
             self.DispatchType + '" QUEUE_PRIORITY[' + i +']="' + self.Priority + '" '
+        # Generic variables with the current load of the queue, when known
+        if self.RunningJobs is not None :
+            info += 'QUEUE_RUNNINGJOBS[' + i + ']=' + str(self.RunningJobs) + ' '
+        if self.QueuedJobs is not None :
+            info += 'QUEUE_QUEUEDJOBS[' + i + ']=' + str(self.QueuedJobs) + ' '
+        return info
 
 class HostInformation( object ) :
 
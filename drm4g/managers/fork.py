@@ -32,8 +32,10 @@ class Resource (drm4g.managers.Resource):
 
 class Job (drm4g.managers.Job):
 
-    def jobSubmit(self, pathScript):
-        out, err = self.Communicator.execCommand('%s %s' % (SH, pathScript))
+    def jobSubmitCommand(self, pathScript):
+        return '%s %s' % (SH, pathScript)
+
+    def jobSubmitResult(self, out, err):
         if err:
             raise drm4g.managers.JobException(' '.join(err.split('\n')))
         job_id = out.rstrip('\n')
@@ -46,16 +48,33 @@ class Job (drm4g.managers.Job):
         else:
             return 'DONE'
 
+    @classmethod
+    def jobsStatusCommand(cls, job_ids):
+        return 'ps -o pid= -o stat= -p %s' % (','.join(job_ids))
+
+    @classmethod
+    def jobsStatusResult(cls, job_ids, out, err):
+        if err.strip():
+            return dict()
+        status = dict((job_id, 'DONE') for job_id in job_ids)
+        for line in out.splitlines():
+            fields = line.split()
+            if len(fields) == 2 and fields[0] in status and not fields[1].startswith('Z'):
+                status[fields[0]] = 'ACTIVE'
+        return status
+
     def jobCancel(self):
+        # The process tree is killed one level at a time
         jobs_to_kill = [self.JobId]
         while jobs_to_kill:
-            for job in jobs_to_kill:
-                out, err = self.Communicator.execCommand('ps ho pid --ppid %s' % (job))
-                jobs_to_kill = [line.lstrip() for line in out.splitlines()] + jobs_to_kill
-                out, err = self.Communicator.execCommand('kill -9 %s' % (job))
+            children = []
+            for out, err, status in self.Communicator.execBatch(['ps ho pid --ppid %s' % (job) for job in jobs_to_kill]):
+                children += [line.strip() for line in out.splitlines() if line.strip()]
+            kills = self.Communicator.execBatch(['kill -9 %s' % (job) for job in jobs_to_kill])
+            for job, (out, err, status) in zip(jobs_to_kill, kills):
                 if err:
                     raise drm4g.managers.JobException('Could not kill %s : %s' % (job, ' '.join(err.split('\n'))))
-                jobs_to_kill.remove(job)
+            jobs_to_kill = children
 
     def jobTemplate(self, parameters):
         line  = '#!/bin/bash\n'
@@ -63,8 +63,10 @@ class Job (drm4g.managers.Job):
                 }
     re_submit=re.compile(r"The job \"(\S+)\" has been submitted")
 
-    def jobSubmit(self, pathScript):
-        out, err = self.Communicator.execCommand('%s %s' % (LLSUBMIT, pathScript))
+    def jobSubmitCommand(self, pathScript):
+        return '%s %s' % (LLSUBMIT, pathScript)
+
+    def jobSubmitResult(self, out, err):
         job_id = self.re_submit.search(out).group(1)
         return job_id
 
@@ -77,6 +79,30 @@ class Job (drm4g.managers.Job):
             status = out.split('\n')[2].strip()
             return self.states_loadleveler.setdefault(status, 'UNKNOWN')
 
+    @classmethod
+    def jobsStatusCommand(cls, job_ids):
+        return '%s -f %%id %%st %s' % (LLQ, ' '.join(job_ids))
+
+    @classmethod
+    def jobsStatusResult(cls, job_ids, out, err):
+        if err.strip():
+            return dict()
+        status = dict((job_id, 'DONE') for job_id in job_ids)
+        if "There is currently no job status to report" in out:
+            return status
+        for line in out.splitlines()[2:]:
+            fields = line.split()
+            if len(fields) != 2:
+                continue
+            step_id, state = fields
+            # The step id is the job id or the job id followed by '.step'
+            parts = step_id.split('.')
+            for end in range(len(parts), 0, -1):
+                job_id = '.'.join(parts[:end])
+                if job_id in status:
+                    status[job_id] = cls.states_loadleveler.get(state, 'UNKNOWN')
+        return status
+
     def jobCancel(self):
         out, err = self.Communicator.execCommand('%s %s' % (LLCANCEL, self.JobId))
         if err:
@@ -34,6 +34,9 @@ class Resource (drm4g.managers.Resource):
 
 class Job (drm4g.managers.Job):
 
+    # LSF arrays are requested through the job name, i.e. -J "name[1-N]"
+    array_index     = 'LSB_JOBINDEX'
+
     #job status <--> GridWay job status
     states_LSF = {'DONE'  : 'DONE',
                   'EXIT'  : 'DONE',
@@ -46,8 +49,10 @@ class Job (drm4g.managers.Job):
                   'UNKWN' : 'UNKNOWN',
                   }
 
-    def jobSubmit(self, pathScript):
-        out, err = self.Communicator.execCommand('%s < %s' % (BSUB, pathScript))
+    def jobSubmitCommand(self, pathScript):
+        return '%s < %s' % (BSUB, pathScript)
+
+    def jobSubmitResult(self, out, err):
         reJobId = re.compile(r'Job <(\d*)> is submitted').search(out)
         if reJobId:
             return reJobId.group(1)
@@ -61,6 +66,31 @@ class Job (drm4g.managers.Job):
         else:
             return self.states_LSF.setdefault(out.split()[10], 'UNKNOWN')
 
+    @classmethod
+    def jobsStatusCommand(cls, job_ids):
+        return '%s %s' % (BJOBS, ' '.join(job_ids))
+
+    @classmethod
+    def jobsStatusResult(cls, job_ids, out, err):
+        status = dict()
+        for line in out.splitlines():
+            fields = line.split()
+            if len(fields) < 3:
+                continue
+            job_id  = fields[0]
+            element = re.search(r'\[(\d+)\]', line)
+            if element and job_id not in job_ids:
+                job_id = '%s[%s]' % (job_id, element.group(1))
+            if job_id in job_ids:
+                status[job_id] = cls.states_LSF.get(fields[2], 'UNKNOWN')
+        return status
+
+    def jobArrayName(self, array_id, tasks):
+        return 'A%s[1-%d]' % (array_id, tasks)
+
+    def jobArrayTaskId(self, array_job_id, index):
+        return '%s[%d]' % (array_job_id, index)
+
     def jobCancel(self):
         out, err = self.Communicator.execCommand('%s %s' % (BKILL, self.JobId))
         if err:
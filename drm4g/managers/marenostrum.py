@@ -57,8 +57,10 @@ class Job (drm4g.managers.Job):
                   'Suspended' : 'SUSPENDED', #Job was running but has been suspended by the scheduler or an admin.
                 }
 
-    def jobSubmit(self, pathScript):
-        out, err = self.Communicator.execCommand('%s %s' % (MNSUBMIT, pathScript))
+    def jobSubmitCommand(self, pathScript):
+        return '%s %s' % (MNSUBMIT, pathScript)
+
+    def jobSubmitResult(self, out, err):
         re_job_id = re.compile(r'Submitted batch job (\d*)').search(err)
         if re_job_id:
             return re_job_id.group(1)
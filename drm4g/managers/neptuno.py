@@ -33,8 +33,10 @@ class Resource (drm4g.managers.slurm.Resource):
 
 class Job (drm4g.managers.slurm.Job):
 
-    def jobSubmit(self, pathScript):
-        out, err = self.Communicator.execCommand('%s %s' % (MSUB, pathScript))
+    def jobSubmitCommand(self, pathScript):
+        return '%s %s' % (MSUB, pathScript)
+
+    def jobSubmitResult(self, out, err):
         if out:
             return out.split()[0]
         else:
@@ -19,6 +19,7 @@
 #
 
 import re
+import xml.dom.minidom
 import drm4g.managers
 from string import Template
 
@@ -34,8 +35,28 @@ QDEL     = 'LANG=POSIX qdel'     #qdel - delete pbs batch job
 
 class Resource (drm4g.managers.Resource):
 
-    def additional_queue_properties(self, queue):
-        out, err = self.Communicator.execCommand('%s -q %s' % (QSTAT, queue.Name))
+    def queue_metrics_command(self):
+        return '%s -Q; echo ---; %s -l free' % (QSTAT, PBSNODES)
+
+    def queue_metrics_result(self, out, err):
+        #output line --> Queue Max Tot Ena Str Que Run Hld Wat Trn Ext T Cpt
+        metrics = dict()
+        queues, _, nodes = out.partition('---\n')
+        free_nodes = str(len([line for line in nodes.splitlines() if line.strip()]))
+        for line in queues.splitlines():
+            fields = line.split()
+            if len(fields) < 7 or not fields[5].isdigit():
+                continue
+            metrics[fields[0]] = dict(FreeNodes=free_nodes,
+                                      Status='active' if fields[3] == 'yes' and fields[4] == 'yes' else 'inactive',
+                                      QueuedJobs=int(fields[5]),
+                                      RunningJobs=int(fields[6]))
+        return metrics
+
+    def additional_queue_command(self, queue):
+        return '%s -q %s' % (QSTAT, queue.Name)
+
+    def additional_queue_result(self, queue, out, err):
         #output line --> Queue Memory CPU_Time Walltime Node Run Que Lm State
         try:
             queueName, _, cpuTime, wallTime, _, _, _, lm = out.splitlines()[5].split()[0:8]
@@ -64,6 +85,9 @@ class Resource (drm4g.managers.Resource):
 
 class Job (drm4g.managers.Job):
 
+    array_directive = '#PBS -t 1-%d'
+    array_index     = 'PBS_ARRAYID'
+
     #pbs job status <--> GridWay job status
     states_pbs = {'E': 'ACTIVE',    #Job is exiting after having run.
                   'H': 'SUSPENDED', #Job is held.
@@ -75,8 +99,10 @@ class Job (drm4g.managers.Job):
                   'C': 'DONE',	    #Job finalize.
                 }
 
-    def jobSubmit(self, pathScript):
-        out, err = self.Communicator.execCommand('%s %s' % (QSUB, pathScript))
+    def jobSubmitCommand(self, pathScript):
+        return '%s %s' % (QSUB, pathScript)
+
+    def jobSubmitResult(self, out, err):
         if err:
             raise drm4g.managers.JobException(' '.join(err.split('\n')))
         return out.strip() #job_id
@@ -91,6 +117,34 @@ class Job (drm4g.managers.Job):
             state = out.split()[-2]
             return self.states_pbs.setdefault(state, 'UNKNOWN')
 
+    @classmethod
+    def jobsStatusCommand(cls, job_ids):
+        return '%s -x %s' % (QSTAT, ' '.join(job_ids))
+
+    @classmethod
+    def jobsStatusResult(cls, job_ids, out, err):
+        if [line for line in err.splitlines() if line.strip() and 'Unknown Job Id' not in line]:
+            return dict()
+        status = dict()
+        # qstat may report the ids with a different server suffix
+        requested = dict()
+        for requested_id in job_ids:
+            requested.setdefault(requested_id.split('.')[0], []).append(requested_id)
+        if out.strip():
+            out_parser = xml.dom.minidom.parseString(out.strip())
+            for job in out_parser.getElementsByTagName('Job'):
+                job_id = job.getElementsByTagName('Job_Id')[0].firstChild.data.strip()
+                state  = job.getElementsByTagName('job_state')[0].firstChild.data.strip()
+                for requested_id in requested.get(job_id.split('.')[0], []):
+                    status[requested_id] = cls.states_pbs.get(state, 'UNKNOWN')
+        if 'Unknown Job Id' in err:
+            for job_id in job_ids:
+                status.setdefault(job_id, 'DONE')
+        return status
+
+    def jobArrayTaskId(self, array_job_id, index):
+        return array_job_id.replace('[]', '[%d]' % index)
+
     def jobCancel(self):
         out, err = self.Communicator.execCommand('%s %s' % (QDEL, self.JobId))
         if err:
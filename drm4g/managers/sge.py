@@ -19,6 +19,7 @@
 #
 
 import re
+import xml.dom.minidom
 import drm4g.managers
 from string import Template
 
@@ -33,8 +34,30 @@ QDEL  = 'LANG=POSIX qdel'
 
 class Resource (drm4g.managers.Resource):
 
-    def additional_queue_properties(self, queue):
-        out, err = self.Communicator.execCommand('%s -sq %s' % (QCONF, queue.Name))
+    def queue_metrics_command(self):
+        return '%s -g c' % (QSTAT)
+
+    def queue_metrics_result(self, out, err):
+        #output line --> CLUSTER QUEUE CQLOAD USED [RES] AVAIL TOTAL aoACDS cdsuE
+        metrics = dict()
+        lines = out.splitlines()
+        if not lines:
+            return metrics
+        header = lines[0].split()[1:]
+        if 'AVAIL' not in header or 'TOTAL' not in header:
+            return metrics
+        for line in lines[1:]:
+            fields = line.split()
+            if len(fields) != len(header):
+                continue
+            metrics[fields[0]] = dict(Nodes=fields[header.index('TOTAL')],
+                                      FreeNodes=fields[header.index('AVAIL')])
+        return metrics
+
+    def additional_queue_command(self, queue):
+        return '%s -sq %s' % (QCONF, queue.Name)
+
+    def additional_queue_result(self, queue, out, err):
         if err:
             raise drm4g.managers.ResourceException(' '.join(err.split('\n')))
         reWalltime = re.compile(r'h_rt\s*(\d+):(\d+):\d+')
@@ -72,8 +95,10 @@ class Job (drm4g.managers.Job):
         'qw' : 'PENDING',  #Job is waiting
         }
 
-    def jobSubmit(self, pathScript):
-        out, err = self.Communicator.execCommand('%s %s' % (QSUB, pathScript))
+    def jobSubmitCommand(self, pathScript):
+        return '%s %s' % (QSUB, pathScript)
+
+    def jobSubmitResult(self, out, err):
         if err:
             raise drm4g.managers.JobException(' '.join(err.split('\n')))
         re_job  = re.compile(r'^Your job (\d*) .*').search(out)
@@ -87,6 +112,23 @@ class Job (drm4g.managers.Job):
             state = out.split()[4]
             return self.states_sge.setdefault(state, 'UNKNOWN')
 
+    @classmethod
+    def jobsStatusCommand(cls, job_ids):
+        return '%s -xml' % (QSTAT)
+
+    @classmethod
+    def jobsStatusResult(cls, job_ids, out, err):
+        if err:
+            raise drm4g.managers.JobException(' '.join(err.split('\n')))
+        status = dict((job_id, 'DONE') for job_id in job_ids)
+        out_parser = xml.dom.minidom.parseString(out.strip())
+        for job in out_parser.getElementsByTagName('job_list'):
+            job_id = job.getElementsByTagName('JB_job_number')[0].firstChild.data.strip()
+            state  = job.getElementsByTagName('state')[0].firstChild.data.strip()
+            if job_id in status:
+                status[job_id] = cls.states_sge.get(state, 'UNKNOWN')
+        return status
+
     def jobCancel(self):
         out, err = self.Communicator.execCommand('%s %s' % (QDEL, self.JobId))
         if err:
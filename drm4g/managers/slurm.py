@@ -28,12 +28,45 @@ from string import Template
 SBATCH  = 'sbatch'   #submit a job
 SQUEUE  = 'squeue'   #show status of jobs
 SCANCEL = 'scancel'  #delete a job
+SINFO   = 'sinfo'    #show partitions and nodes
 
 class Resource (drm4g.managers.Resource):
-    pass
+
+    def queue_metrics_command(self):
+        return '%s -h -o "%%P %%a %%C"; echo ---; %s -h -o "%%P %%T"' % (SINFO, SQUEUE)
+
+    def queue_metrics_result(self, out, err):
+        metrics = dict()
+        partitions, _, jobs = out.partition('---\n')
+        for line in partitions.splitlines():
+            try:
+                partition, avail, cpus = line.split()
+                _, idle, _, total = cpus.split('/')
+            except ValueError:
+                continue
+            queue = dict(Nodes=total, FreeNodes=idle, Status=avail, RunningJobs=0, QueuedJobs=0)
+            metrics[partition.rstrip('*')] = queue
+            if partition.endswith('*'):
+                metrics['default'] = queue
+        for line in jobs.splitlines():
+            try:
+                partitions, state = line.split()
+            except ValueError:
+                continue
+            for partition in partitions.split(','):
+                if partition not in metrics:
+                    continue
+                if state == 'RUNNING':
+                    metrics[partition]['RunningJobs'] += 1
+                elif state == 'PENDING':
+                    metrics[partition]['QueuedJobs'] += 1
+        return metrics
 
 class Job (drm4g.managers.Job):
 
+    array_directive = '#SBATCH --array=1-%d'
+    array_index     = 'SLURM_ARRAY_TASK_ID'
+
     #job status <--> GridWay job status
     states_SLURM = {'CANCELLED': 'DONE',
                   'COMPLETED' : 'DONE',
@@ -46,8 +79,10 @@ class Job (drm4g.managers.Job):
                   'TIMEOUT'   : 'FAILED',
                 }
 
-    def jobSubmit(self, pathScript):
-        out, err = self.Communicator.execCommand('%s %s' % (SBATCH, pathScript))
+    def jobSubmitCommand(self, pathScript):
+        return '%s %s' % (SBATCH, pathScript)
+
+    def jobSubmitResult(self, out, err):
         re_job_id = re.compile(r'Submitted batch job (\d*)').search(out)
         if re_job_id:
             return re_job_id.group(1)
@@ -61,6 +96,27 @@ class Job (drm4g.managers.Job):
         else:
             return self.states_SLURM.setdefault(out.rstrip('\n'), 'UNKNOWN')
 
+    @classmethod
+    def jobsStatusCommand(cls, job_ids):
+        return '%s -h -r -o "%%i %%T" -j %s' % (SQUEUE, ','.join(job_ids))
+
+    @classmethod
+    def jobsStatusResult(cls, job_ids, out, err):
+        if err.strip():
+            return dict()
+        status = dict((job_id, 'DONE') for job_id in job_ids)
+        for line in out.splitlines():
+            try:
+                job_id, state = line.split()
+            except ValueError:
+                continue
+            if job_id in status:
+                status[job_id] = cls.states_SLURM.get(state, 'UNKNOWN')
+        return status
+
+    def jobArrayTaskId(self, array_job_id, index):
+        return '%s_%d' % (array_job_id, index)
+
     def jobCancel(self):
         out, err = self.Communicator.execCommand('%s %s' % (SCANCEL, self.JobId))
         if err:
@@ -49,8 +49,10 @@ class Job (drm4g.managers.Job):
                   'TIMEOUT'   : 'FAILED',
                 }
 
-    def jobSubmit(self, pathScript):
-        out, err = self.Communicator.execCommand('%s %s' % (MNSUBMIT, pathScript))
+    def jobSubmitCommand(self, pathScript):
+        return '%s %s' % (MNSUBMIT, pathScript)
+
+    def jobSubmitResult(self, out, err):
         re_job_id = re.compile(r'Submitted batch job (\d*)').search(out)
         if re_job_id:
             return re_job_id.group(1)
@@ -65,6 +67,21 @@ class Job (drm4g.managers.Job):
             state = out.split()[3]
             return self.states_altamira.setdefault(state, 'UNKNOWN')
 
+    @classmethod
+    def jobsStatusCommand(cls, job_ids):
+        return '%s -h' % (MNQ)
+
+    @classmethod
+    def jobsStatusResult(cls, job_ids, out, err):
+        if err:
+            raise drm4g.managers.JobException(' '.join(err.split('\n')))
+        status = dict((job_id, 'DONE') for job_id in job_ids)
+        for line in out.splitlines():
+            fields = line.split()
+            if len(fields) > 3 and fields[0] in status:
+                status[fields[0]] = cls.states_altamira.get(fields[3], 'UNKNOWN')
+        return status
+
     def jobCancel(self):
         out, err = self.Communicator.execCommand('%s %s' % (MNCANCEL, self.JobId))
         if err:
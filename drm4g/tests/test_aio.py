@@ -0,0 +1,37 @@
+import time
+import asyncio
+
+import pytest
+
+from drm4g.communicators.local import Communicator
+from drm4g.utils.aio import get_event_loop, run_process
+
+
+def test_local_exec_command_async():
+    communicator = Communicator()
+
+    async def run_all():
+        return await asyncio.gather(*[communicator.execCommandAsync('sleep 0.5; echo %d' % i)
+                                      for i in range(50)])
+
+    start = time.time()
+    results = get_event_loop().run(run_all(), 30)
+    assert time.time() - start < 5
+    assert [out for out, err in results] == ['%d\n' % i for i in range(50)]
+
+
+def test_run_process_timeout():
+    start = time.time()
+    with pytest.raises(asyncio.TimeoutError):
+        get_event_loop().run(run_process(['sleep', '10'], timeout=0.2), 5)
+    assert time.time() - start < 5
+
+
+def test_exec_command_async_fallback():
+    from drm4g.communicators import Communicator as BaseCommunicator
+
+    class SyncCommunicator(BaseCommunicator):
+        def execCommand(self, command, input=None):
+            return command.upper(), ''
+
+    assert get_event_loop().run(SyncCommunicator().execCommandAsync('qstat'), 5) == ('QSTAT', '')
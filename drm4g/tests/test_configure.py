@@ -0,0 +1,89 @@
+import os
+
+import drm4g.core.configure
+from drm4g.core.configure import Configuration
+
+RESOURCES_CONF = """[local]
+enable            = true
+communicator      = local
+frontend          = localhost
+lrms              = fork
+max_jobs_running  = %d
+"""
+
+
+def test_configuration_cache(tmp_path, monkeypatch):
+    conf = tmp_path / 'resources.conf'
+    conf.write_text(RESOURCES_CONF % 1)
+    monkeypatch.setattr(drm4g.core.configure, 'DRM4G_RESOURCES_CONF', str(conf))
+    monkeypatch.setattr(drm4g.core.configure, '_cache', dict())
+    calls = {'parse': 0, 'check': 0}
+    parse, check = Configuration._parse, Configuration._check
+
+    def counting_parse(self, content):
+        calls['parse'] += 1
+        return parse(self, content)
+
+    def counting_check(self):
+        calls['check'] += 1
+        return check(self)
+
+    monkeypatch.setattr(Configuration, '_parse', counting_parse)
+    monkeypatch.setattr(Configuration, '_check', counting_check)
+    for _ in range(3):
+        config = Configuration()
+        config.load()
+        assert config.check() == []
+        assert config.resources['local']['queue'] == 'default'
+    assert calls == {'parse': 1, 'check': 1}
+    config.resources['local']['enable'] = 'false'
+    os.utime(str(conf), (0, 0))
+    config = Configuration()
+    config.load()
+    assert config.resources['local']['enable'] == 'true'
+    assert calls['parse'] == 1
+    conf.write_text(RESOURCES_CONF % 22)
+    config = Configuration()
+    config.load()
+    config.check()
+    assert config.resources['local']['max_jobs_running'] == '22'
+    assert calls == {'parse': 2, 'check': 2}
+
+
+def test_check_cache_key_files(tmp_path, monkeypatch):
+    conf = tmp_path / 'resources.conf'
+    key = tmp_path / 'id_rsa'
+    conf.write_text(RESOURCES_CONF.replace('communicator      = local',
+                                           'communicator      = op_ssh\nusername          = user\n'
+                                           'private_key       = %s' % key) % 1)
+    monkeypatch.setattr(drm4g.core.configure, 'DRM4G_RESOURCES_CONF', str(conf))
+    monkeypatch.setattr(drm4g.core.configure, '_cache', dict())
+    config = Configuration()
+    config.load()
+    assert "'%s' does not exist for 'local' resource" % key in config.check()
+    key.write_text('key')
+    config = Configuration()
+    config.load()
+    assert config.check() == []
+    assert config.resources['local']['private_key'] == str(key)
+
+
+def test_configuration_cache_same_size_rewrite(tmp_path, monkeypatch):
+    conf = tmp_path / 'resources.conf'
+    monkeypatch.setattr(drm4g.core.configure, 'DRM4G_RESOURCES_CONF', str(conf))
+    monkeypatch.setattr(drm4g.core.configure, '_cache', dict())
+    # both mtimes are the same float, they only differ in nanoseconds
+    mtime = 1700000000 * 10 ** 9 + 10
+    conf.write_text(RESOURCES_CONF % 11)
+    os.utime(str(conf), ns=(mtime, mtime))
+    first = os.stat(str(conf))
+    config = Configuration()
+    config.load()
+    assert config.resources['local']['max_jobs_running'] == '11'
+    conf.write_text(RESOURCES_CONF % 22)
+    os.utime(str(conf), ns=(mtime + 50, mtime + 50))
+    second = os.stat(str(conf))
+    assert (second.st_mtime, second.st_size) == (first.st_mtime, first.st_size)
+    config = Configuration()
+    config.load()
+    assert config.resources['local']['max_jobs_running'] == '22'
@@ -0,0 +1,360 @@
+import time
+import threading
+
+from drm4g.core.em_mad    import GwEmMad
+from drm4g.managers       import Job
+from drm4g.utils.dynamic  import ThreadPool
+from drm4g.utils.registry import JobRegistry
+
+
+class FakeCommunicator(object):
+    frontend = 'fake'
+
+    def __init__(self):
+        self.commands = []
+
+    def execCommand(self, command, input=None):
+        self.commands.append(command)
+        return '', ''
+
+
+class BulkJob(Job):
+
+    calls = []
+
+    @classmethod
+    def jobsStatus(cls, communicator, job_ids):
+        cls.calls.append(list(job_ids))
+        return dict((job_id, 'ACTIVE') for job_id in job_ids)
+
+    def jobStatus(self):
+        raise AssertionError("jobStatus should not be called")
+
+
+class SingleJob(Job):
+
+    def jobStatus(self):
+        self.Communicator.execCommand('status %s' % self.JobId)
+        return 'DONE'
+
+
+def _submitted(gw_em_mad, job_class, communicator, number):
+    for i in range(number):
+        job = job_class()
+        job.Communicator = communicator
+        job.JobId = '%s%d' % (job_class.__name__, i)
+        job.setStatus('PENDING')
+        gw_em_mad._job_list.put('%s-%d' % (job_class.__name__, i), job)
+
+
+def test_callback_bulk_status(capsys):
+    gw_em_mad = GwEmMad()
+    _submitted(gw_em_mad, BulkJob, FakeCommunicator(), 5)
+    gw_em_mad._callback_sweep(gw_em_mad._job_list.items())
+    assert len(BulkJob.calls) == 1
+    assert len(BulkJob.calls[0]) == 5
+    assert capsys.readouterr().out.count('SUCCESS ACTIVE') == 5
+
+
+def test_callback_fallback_status(capsys):
+    gw_em_mad = GwEmMad()
+    communicator = FakeCommunicator()
+    _submitted(gw_em_mad, SingleJob, communicator, 3)
+    gw_em_mad._callback_sweep(gw_em_mad._job_list.items())
+    assert len(communicator.commands) == 3
+    assert capsys.readouterr().out.count('SUCCESS DONE') == 3
+    assert not gw_em_mad._job_list.items()
+
+
+def test_callback_schedule():
+    gw_em_mad = GwEmMad()
+    _submitted(gw_em_mad, BulkJob, FakeCommunicator(), 2)
+    (JID0, job0), (JID1, job1) = sorted(gw_em_mad._job_list.items())
+    gw_em_mad._schedule(JID0, job0)
+    gw_em_mad._schedule(JID1, job1)
+    gw_em_mad._poll_info[JID1]['since'] -= 7 * 24 * 3600
+    gw_em_mad._schedule(JID1, job1)
+    assert gw_em_mad._poll_info[JID0]['deadline'] - time.time() <= gw_em_mad._min_callback_interval + gw_em_mad._poll_tick
+    assert gw_em_mad._poll_info[JID1]['deadline'] - time.time() > gw_em_mad._callback_interval
+    job0.setStatus('ACTIVE')
+    gw_em_mad._poll_info[JID0]['deadline'] = 0
+    gw_em_mad._poll_queue[:] = [(0, JID0)]
+    assert gw_em_mad._due_jobs() == [(JID0, job0)]
+
+
+class SlowJob(Job):
+
+    release = threading.Event()
+
+    @classmethod
+    def jobsStatus(cls, communicator, job_ids):
+        cls.release.wait(10)
+        return dict((job_id, 'ACTIVE') for job_id in job_ids)
+
+
+def test_callback_concurrent_resources(capsys):
+    gw_em_mad = GwEmMad()
+    gw_em_mad._pool = ThreadPool(2, 4)
+    _submitted(gw_em_mad, SlowJob, FakeCommunicator(), 1)
+    _submitted(gw_em_mad, BulkJob, FakeCommunicator(), 1)
+    gw_em_mad._callback_sweep(gw_em_mad._job_list.items())
+    try:
+        deadline = time.time() + 5
+        while 'BulkJob-0 SUCCESS' not in capsys.readouterr().out:
+            assert time.time() < deadline
+            time.sleep(0.05)
+    finally:
+        SlowJob.release.set()
+
+
+def test_recover_from_registry(tmp_path, capsys):
+    registry = JobRegistry(str(tmp_path / 'em_jobs.db'))
+    for i in range(3):
+        registry.put('%d' % i, 'fake', 'BulkJob%d' % i, 'PENDING')
+    gw_em_mad = GwEmMad()
+    gw_em_mad._registry = registry
+    gw_em_mad._update_resource = lambda host: (BulkJob(), FakeCommunicator())
+    del BulkJob.calls[:]
+    gw_em_mad._load_registry()
+    gw_em_mad.do_RECOVER('RECOVER 1 fake:BulkJob1 -')
+    assert 'RECOVER 1 SUCCESS ACTIVE' in capsys.readouterr().out
+    assert len(BulkJob.calls) == 1
+    assert sorted(row[3] for row in registry.items()) == ['ACTIVE'] * 3
+
+
+def test_dispatch_keeps_jid_order():
+    gw_em_mad = GwEmMad()
+    gw_em_mad._pool = ThreadPool(2, 4)
+    done = []
+    started = threading.Event()
+
+    def slow_submit(self, args):
+        started.set()
+        time.sleep(0.3)
+        done.append(args)
+
+    def fast(self, args):
+        done.append(args)
+
+    gw_em_mad._dispatch('1', slow_submit, 'SUBMIT 1')
+    started.wait(5)
+    gw_em_mad._dispatch('1', fast, 'CANCEL 1')
+    gw_em_mad._dispatch('2', fast, 'SUBMIT 2')
+    deadline = time.time() + 5
+    while (len(done) < 3 or gw_em_mad._jid_tasks) and time.time() < deadline:
+        time.sleep(0.05)
+    assert done == ['SUBMIT 2', 'SUBMIT 1', 'CANCEL 1']
+    assert not gw_em_mad._jid_tasks
+
+
+class ArrayCommunicator(FakeCommunicator):
+    username = 'user'
+
+    def execCommand(self, command, input=None):
+        self.commands.append(command)
+        if 'DRM4G_WRAPPER_STAGED' in command:
+            return 'DRM4G_WRAPPER_STAGED\nSubmitted batch job 77\n', ''
+        return 'Submitted batch job 77\n', ''
+
+
+def test_submit_array(tmp_path, capsys):
+    import drm4g.managers.slurm
+    gw_em_mad = GwEmMad()
+    communicator = ArrayCommunicator()
+    for i in range(3):
+        job = drm4g.managers.slurm.Job()
+        job.Communicator = communicator
+        rsl = {'environment': {'GW_JOB_ID': str(i), 'GW_ARRAY_ID': '4', 'GW_TOTAL_TASKS': '3'},
+               'executable': '/scratch/%d/job.sh' % i, 'stdout': '/scratch/%d/stdout' % i,
+               'stderr': '/scratch/%d/stderr' % i, 'queue': 'default', 'count': '1'}
+        assert gw_em_mad._is_array_task(job, rsl)
+        gw_em_mad._add_array_task(str(i), 'fake', job, rsl, str(tmp_path / ('wrapper_drm4g.%d' % i)),
+                                  '/scratch/%d/wrapper_drm4g' % i, '')
+    assert len(communicator.commands) == 1
+    assert '#SBATCH --array=1-3' in communicator.commands[0]
+    assert 'SBATCH --job-name=JID_A4' in communicator.commands[0]
+    out = capsys.readouterr().out
+    for i in range(3):
+        assert 'SUBMIT %d SUCCESS fake:77_%d' % (i, i + 1) in out
+    assert not gw_em_mad._arrays
+
+
+def test_submit_array_fails_part_way(tmp_path, capsys):
+    import drm4g.managers.slurm
+    gw_em_mad = GwEmMad()
+    gw_em_mad._registry = JobRegistry(':memory:')
+    communicator = ArrayCommunicator()
+    schedule = gw_em_mad._schedule
+
+    def failing_schedule(JID, job, walltime=None, interval=None):
+        if JID == '1':
+            raise Exception('Lost connection')
+        schedule(JID, job, walltime, interval)
+
+    gw_em_mad._schedule = failing_schedule
+    for i in range(3):
+        job = drm4g.managers.slurm.Job()
+        job.Communicator = communicator
+        job.resfeatures = {}
+        rsl = {'environment': {'GW_JOB_ID': str(i), 'GW_ARRAY_ID': '4', 'GW_TOTAL_TASKS': '3'},
+               'executable': '/scratch/%d/job.sh' % i, 'stdout': '/scratch/%d/stdout' % i,
+               'stderr': '/scratch/%d/stderr' % i, 'queue': 'default', 'count': '1'}
+        gw_em_mad._add_array_task(str(i), 'fake', job, rsl, str(tmp_path / ('wrapper_drm4g.%d' % i)),
+                                  '/scratch/%d/wrapper_drm4g' % i, '')
+    out = capsys.readouterr().out
+    for i in range(3):
+        assert 'SUBMIT %d FAILURE Lost connection' % i in out
+    assert 'SUCCESS' not in out
+    assert not gw_em_mad._job_list.items()
+    assert not gw_em_mad._poll_info
+    assert not list(gw_em_mad._registry.items())
+    assert communicator.commands[-1].endswith(' 77')
+
+
+def test_update_resource_features_per_job():
+    class FakeConfiguration(object):
+        resources = {'fake': {'lrms': 'fork', 'vo': 'esr'}}
+
+        def check_update(self):
+            return False
+
+        def get_manager(self, resname):
+            import drm4g.managers.fork
+            return drm4g.managers.fork
+
+        def make_communicator(self, resname):
+            return FakeCommunicator()
+
+    gw_em_mad = GwEmMad()
+    gw_em_mad._configure = FakeConfiguration()
+    job0, communicator0 = gw_em_mad._update_resource('fake::ce0')
+    job1, communicator1 = gw_em_mad._update_resource('fake::ce1')
+    job0.resfeatures['host'] = 'ce0'
+    assert 'host' not in job1.resfeatures
+    assert 'host' not in FakeConfiguration.resources['fake']
+    assert communicator0 is communicator1
+
+
+def test_recover_waits_for_its_host(capsys):
+    release = threading.Event()
+
+    class HangingJob(BulkJob):
+        @classmethod
+        def jobsStatus(cls, communicator, job_ids):
+            release.wait(10)
+            return dict()
+
+        def jobStatus(self):
+            return 'PENDING'
+
+    gw_em_mad = GwEmMad()
+    gw_em_mad._registry = JobRegistry(':memory:')
+    gw_em_mad._registry.put('0', 'down', 'HangingJob0', 'PENDING')
+    gw_em_mad._registry.put('1', 'up', 'BulkJob1', 'PENDING')
+    gw_em_mad._update_resource = lambda host: ((HangingJob if host == 'down' else BulkJob)(), FakeCommunicator())
+    gw_em_mad._recover_timeout = 0.2
+    try:
+        start = time.time()
+        gw_em_mad._load_registry()
+        gw_em_mad.do_RECOVER('RECOVER 1 up:BulkJob1 -')
+        assert 'RECOVER 1 SUCCESS ACTIVE' in capsys.readouterr().out
+        gw_em_mad.do_RECOVER('RECOVER 0 down:HangingJob0 -')
+        assert 'RECOVER 0 SUCCESS PENDING' in capsys.readouterr().out
+        assert time.time() - start < 5
+    finally:
+        release.set()
+
+
+def test_array_task_blocks_jid(tmp_path, capsys):
+    import drm4g.managers.slurm
+    gw_em_mad = GwEmMad()
+    gw_em_mad._pool = ThreadPool(2, 4)
+    gw_em_mad._array_window = 0.3
+    communicator = ArrayCommunicator()
+
+    def submit(self, args):
+        job = drm4g.managers.slurm.Job()
+        job.Communicator = communicator
+        rsl = {'environment': {'GW_JOB_ID': '0', 'GW_ARRAY_ID': '5', 'GW_TOTAL_TASKS': '2'},
+               'executable': '/scratch/0/job.sh', 'stdout': '/scratch/0/stdout',
+               'stderr': '/scratch/0/stderr', 'queue': 'default', 'count': '1'}
+        self._add_array_task('0', 'fake', job, rsl, str(tmp_path / 'wrapper_drm4g.0'),
+                             '/scratch/0/wrapper_drm4g', '')
+        return True
+
+    gw_em_mad._dispatch('0', submit, 'SUBMIT 0')
+    gw_em_mad._dispatch('0', GwEmMad.do_POLL, 'POLL 0 - -')
+    deadline = time.time() + 5
+    out = ''
+    while 'POLL 0' not in out and time.time() < deadline:
+        time.sleep(0.05)
+        out += capsys.readouterr().out
+    assert out.index('SUBMIT 0 SUCCESS') < out.index('POLL 0 SUCCESS')
+
+
+class SleepJob(Job):
+
+    @classmethod
+    def jobsStatusCommand(cls, job_ids):
+        return 'sleep 1'
+
+    @classmethod
+    def jobsStatusResult(cls, job_ids, out, err):
+        return dict((job_id, 'ACTIVE') for job_id in job_ids)
+
+
+def test_callback_status_in_event_loop(capsys):
+    from drm4g.communicators.local import Communicator
+    from drm4g.utils.aio import get_event_loop
+    gw_em_mad = GwEmMad()
+    gw_em_mad._pool = ThreadPool(2, 4)
+    gw_em_mad._loop = get_event_loop()
+    for i in range(20):
+        job = SleepJob()
+        job.Communicator = Communicator()
+        job.JobId = str(i)
+        job.setStatus('PENDING')
+        gw_em_mad._job_list.put(str(i), job)
+    start = time.time()
+    gw_em_mad._callback_sweep(gw_em_mad._job_list.items())
+    out = ''
+    while out.count('SUCCESS ACTIVE') < 20 and time.time() - start < 10:
+        time.sleep(0.05)
+        out += capsys.readouterr().out
+    # 20 queries of one second each, waited for at once by the event loop
+    assert out.count('SUCCESS ACTIVE') == 20
+    assert time.time() - start < 4
+
+
+def test_callback_one_query_per_tick(monkeypatch):
+    import drm4g.core.em_mad
+
+    class TickJob(Job):
+        calls = []
+
+        @classmethod
+        def jobsStatus(cls, communicator, job_ids):
+            cls.calls.append((clock[0], len(job_ids)))
+            return dict((job_id, 'PENDING') for job_id in job_ids)
+
+    clock = [1000.0]
+    monkeypatch.setattr(drm4g.core.em_mad.time, 'time', lambda: clock[0])
+    gw_em_mad = GwEmMad()
+    communicator = FakeCommunicator()
+    # Jobs submitted to the same resource at different times
+    for i in range(100):
+        clock[0] += 0.37
+        job = TickJob()
+        job.Communicator = communicator
+        job.JobId = str(i)
+        job.setStatus('PENDING')
+        gw_em_mad._job_list.put(str(i), job)
+        gw_em_mad._schedule(str(i), job)
+    start = clock[0]
+    while clock[0] - start < 600:
+        clock[0] = max(clock[0], gw_em_mad._poll_queue[0][0])
+        gw_em_mad._callback_sweep(gw_em_mad._due_jobs())
+    ticks = set(when for when, _ in TickJob.calls)
+    assert len(ticks) == len(TickJob.calls)
+    assert len(TickJob.calls) <= 600 / gw_em_mad._poll_tick + 1
+    assert sum(size for _, size in TickJob.calls) / len(TickJob.calls) > 10
@@ -1,4 +1,44 @@
+import time
+import threading
+
 from drm4g.core.im_mad import GwImMad
+from drm4g.managers    import Resource
+
+
+class FakeCommunicator(object):
+
+    def __init__(self):
+        self.alive = True
+        self.closed = False
+
+    def connect(self):
+        pass
+
+    def execCommand(self, command, input=None):
+        return ('DRM4G\n' if self.alive else ''), ''
+
+    def close(self):
+        self.closed = True
+
+
+class FakeConfiguration(object):
+
+    def __init__(self):
+        self.resources = {'fake': {'frontend': 'fake'}}
+        self.made = []
+
+    def make_communicator(self, name):
+        self.made.append(FakeCommunicator())
+        return self.made[-1]
+
+
+class SlowResource(Resource):
+
+    release = threading.Event()
+
+    def hosts(self):
+        self.release.wait(10)
+        return Resource.hosts(self)
 
 
 def test_GwImMad():
@@ -8,5 +48,112 @@ def test_GwImMad():
     gw_im_mad.do_MONITOR(args, output=True)
 
 
+def _resource(resource_class, name):
+    resource = resource_class()
+    resource.name = name
+    resource.Communicator = FakeCommunicator()
+    return {'Resource': resource}
+
+
+def test_discover_partial_results():
+    gw_im_mad = GwImMad()
+    gw_im_mad._discover_timeout = 0.2
+    gw_im_mad._get_communicator = lambda resname: FakeCommunicator()
+    gw_im_mad._resources = {'fast': _resource(Resource, 'fast'),
+                            'slow': _resource(SlowResource, 'slow')}
+    start = time.time()
+    assert gw_im_mad._discover_hosts(['fast', 'slow']).split() == ['fast']
+    assert time.time() - start < 5
+    SlowResource.release.set()
+    deadline = time.time() + 5
+    while 'slow' not in gw_im_mad._discovered and time.time() < deadline:
+        time.sleep(0.05)
+    assert gw_im_mad._discover_hosts(['fast', 'slow']).split() == ['fast', 'slow']
+    assert gw_im_mad._resources['slow']['Resource'].host_list == ['slow']
+
+
+def test_warm_communicators():
+    gw_im_mad = GwImMad()
+    gw_im_mad._config = config = FakeConfiguration()
+    communicator = gw_im_mad._get_communicator('fake')
+    assert gw_im_mad._get_communicator('fake') is communicator
+    gw_im_mad._communicators['fake']['last_used'] -= gw_im_mad._communicator_check + 1
+    communicator.alive = False
+    assert gw_im_mad._get_communicator('fake') is not communicator
+    assert communicator.closed
+    config.resources['fake'] = {'frontend': 'other'}
+    assert gw_im_mad._get_communicator('fake') is config.made[-1]
+    assert len(config.made) == 3
+    gw_im_mad._communicators['fake']['last_used'] -= gw_im_mad._communicator_idle + 1
+    gw_im_mad._expire_communicators()
+    assert not gw_im_mad._communicators
+    assert config.made[-1].closed
+
+
+class BytesCommunicator(FakeCommunicator):
+
+    def execCommand(self, command, input=None):
+        # like openssh, bytes output and None when the command failed
+        return (b'DRM4G\n', b'') if self.alive else None
+
+
+def test_is_alive_bytes_output():
+    gw_im_mad = GwImMad()
+    communicator = BytesCommunicator()
+    assert gw_im_mad._is_alive(communicator)
+    communicator.alive = False
+    assert not gw_im_mad._is_alive(communicator)
+
+
+def test_update_resources():
+    class Config(object):
+        def __init__(self, resources):
+            self.resources = resources
+            self.made = []
+
+        def make_resource(self, name):
+            self.made.append(name)
+            return {'Resource': Resource()}
+
+    gw_im_mad = GwImMad()
+    first = Config({'a': {'lrms': 'fork'}, 'b': {'lrms': 'fork'}, 'c': {'lrms': 'fork'}})
+    gw_im_mad._resources = gw_im_mad._update_resources(first)
+    gw_im_mad._config = first
+    kept = gw_im_mad._resources['a']
+    second = Config({'a': {'lrms': 'fork'}, 'b': {'lrms': 'pbs'}, 'd': {'lrms': 'fork'}})
+    resources = gw_im_mad._update_resources(second)
+    assert sorted(first.made) == ['a', 'b', 'c']
+    assert sorted(second.made) == ['b', 'd']
+    assert resources['a'] is kept
+    assert sorted(resources) == ['a', 'b', 'd']
+
+
+def test_monitor_concurrent_resources():
+    from drm4g.utils.dynamic import ThreadPool
+    gw_im_mad = GwImMad()
+    gw_im_mad._pool = ThreadPool(2, 4)
+    done = []
+    release = threading.Event()
+
+    def slow(self, args):
+        release.wait(5)
+        done.append(args)
+
+    def fast(self, args):
+        done.append(args)
+
+    gw_im_mad._dispatch('a', slow, 'MONITOR 0 a -')
+    gw_im_mad._dispatch('a', fast, 'MONITOR 1 a -')
+    gw_im_mad._dispatch('b', fast, 'MONITOR 2 b -')
+    deadline = time.time() + 5
+    while not done and time.time() < deadline:
+        time.sleep(0.05)
+    assert done == ['MONITOR 2 b -']
+    release.set()
+    while (len(done) < 3 or gw_im_mad._resource_tasks) and time.time() < deadline:
+        time.sleep(0.05)
+    assert done == ['MONITOR 2 b -', 'MONITOR 0 a -', 'MONITOR 1 a -']
+
+
 if __name__ == "__main__":
     test_GwImMad()
@@ -0,0 +1,200 @@
+import os
+import time
+import subprocess
+
+import drm4g.managers.fork
+import drm4g.managers.slurm
+from drm4g.communicators.local import Communicator
+from drm4g.managers import JOBS_STATUS_END
+
+
+class FakeCommunicator(object):
+    username = 'user'
+    frontend = 'fake'
+
+    def __init__(self, out, err=''):
+        self.out = out
+        self.err = err
+        self.commands = []
+
+    def execCommand(self, command, input=None):
+        self.commands.append(command)
+        return self.out, self.err
+
+
+class CountingCommunicator(Communicator):
+
+    def __init__(self):
+        Communicator.__init__(self)
+        self.commands = []
+
+    def execCommand(self, command, input=None):
+        self.commands.append(command)
+        return Communicator.execCommand(self, command, input)
+
+
+def test_fork_jobs_status():
+    proc = subprocess.Popen(['sleep', '30'])
+    try:
+        status = drm4g.managers.fork.Job.jobsStatus(Communicator(), [str(proc.pid), '999999'])
+    finally:
+        proc.kill()
+        proc.wait()
+    assert status == {str(proc.pid): 'ACTIVE', '999999': 'DONE'}
+
+
+def test_slurm_jobs_status():
+    communicator = FakeCommunicator('12 RUNNING\n13 PENDING\n%s\n' % JOBS_STATUS_END)
+    status = drm4g.managers.slurm.Job.jobsStatus(communicator, ['12', '13', '14'])
+    assert status == {'12': 'ACTIVE', '13': 'PENDING', '14': 'DONE'}
+
+
+def test_jobs_status_failed_query():
+    # The connection failed before the query ended
+    assert drm4g.managers.slurm.Job.jobsStatus(FakeCommunicator(''), ['12', '13']) == {}
+    assert drm4g.managers.fork.Job.jobsStatus(FakeCommunicator('12 S\n'), ['12', '13']) == {}
+    communicator = FakeCommunicator('%s\n' % JOBS_STATUS_END, 'squeue: error: Unable to contact slurm controller')
+    assert drm4g.managers.slurm.Job.jobsStatus(communicator, ['12', '13']) == {}
+    assert drm4g.managers.slurm.Job.jobsStatus(FakeCommunicator('%s\n' % JOBS_STATUS_END), ['12']) == {'12': 'DONE'}
+
+
+def test_pbs_jobs_status():
+    import drm4g.managers.pbs
+    communicator = FakeCommunicator('<Data><Job><Job_Id>12.srv.org</Job_Id><job_state>R</job_state></Job>'
+                                    '<Job><Job_Id>13[2].srv</Job_Id><job_state>Q</job_state></Job></Data>\n' + JOBS_STATUS_END,
+                                    'qstat: Unknown Job Id 14.srv')
+    status = drm4g.managers.pbs.Job.jobsStatus(communicator, ['12.srv', '13[2].srv.org', '14.srv'])
+    assert status == {'12.srv': 'ACTIVE', '13[2].srv.org': 'PENDING', '14.srv': 'DONE'}
+
+
+def test_abs_directory_cache():
+    communicator = FakeCommunicator('/home/user/.drm4g/jobs\n')
+    for _ in range(3):
+        job = drm4g.managers.fork.Job()
+        job.Communicator = communicator
+        assert job.get_abs_directory('~/.drm4g/jobs') == '/home/user/.drm4g/jobs'
+    assert len(communicator.commands) == 1
+    job.invalidate_abs_directory('~/.drm4g/jobs')
+    job.get_abs_directory('~/.drm4g/jobs')
+    assert len(communicator.commands) == 2
+
+
+def test_fork_stage_submit(tmp_path):
+    job = drm4g.managers.fork.Job()
+    job.Communicator = Communicator()
+    template = job.jobTemplate({'environment': {'GW_JOB_ID': '0'},
+                                'executable': "echo 'done' \"$HOME\"",
+                                'stdout': str(tmp_path / 'stdout'),
+                                'stderr': str(tmp_path / 'stderr')})
+    remote_file = str(tmp_path / 'wrapper_drm4g')
+    job_id = job.jobStageSubmit(str(tmp_path / 'wrapper_drm4g.0'), remote_file, template)
+    assert job_id.isdigit()
+    assert open(remote_file).read() == template
+    assert os.access(remote_file, os.X_OK)
+
+
+class CshCommunicator(CountingCommunicator):
+    """
+    Login shell unable to run the staging command.
+    """
+    def execCommand(self, command, input=None):
+        if command.startswith('sh -c'):
+            self.commands.append(command)
+            return '', 'sh: Command not found.\n'
+        return CountingCommunicator.execCommand(self, command, input)
+
+
+def test_fork_stage_submit_fallback(tmp_path):
+    job = drm4g.managers.fork.Job()
+    job.Communicator = CshCommunicator()
+    template = job.jobTemplate({'environment': {'GW_JOB_ID': '0'},
+                                'executable': "echo 'done'",
+                                'stdout': str(tmp_path / 'stdout'),
+                                'stderr': str(tmp_path / 'stderr')})
+    local_file = tmp_path / 'wrapper_drm4g.0'
+    local_file.write_text(template)
+    remote_file = str(tmp_path / 'wrapper_drm4g')
+    job_id = job.jobStageSubmit(str(local_file), remote_file, template)
+    assert job_id.isdigit()
+    assert job.Communicator.commands[0].startswith('sh -c')
+    assert open(remote_file).read() == template
+    assert os.access(remote_file, os.X_OK)
+
+
+def test_host_properties_cache(tmp_path):
+    from drm4g.managers import Resource
+    from drm4g.utils.cache import HostCache
+    communicator = CountingCommunicator()
+    resource = Resource()
+    resource.name = 'fake'
+    resource.features = {'queue': 'short', 'max_jobs_running': '4',
+                         'max_jobs_in_queue': '8', 'lrms': 'fork'}
+    resource.Communicator = communicator
+    resource.cache = HostCache(str(tmp_path / 'im_hosts.db'))
+    info = resource.host_properties('fake')
+    assert len(communicator.commands) == 1
+    resource.cache = HostCache(str(tmp_path / 'im_hosts.db'))
+    assert resource.host_properties('fake') == info
+    assert len(communicator.commands) == 1
+    assert 'QUEUE_MAXRUNNINGJOBS[0]=4' in info
+
+
+def test_host_properties_probe():
+    from drm4g.managers import Resource
+
+    class ProbeResource(Resource):
+        def additional_queue_command(self, queue):
+            return 'echo %s-limit; echo %s-warning >&2' % (queue.Name, queue.Name)
+
+        def additional_queue_result(self, queue, out, err):
+            queue.Status = '%s/%s' % (out.strip(), err.strip())
+            return queue
+
+    resource = ProbeResource()
+    resource.name = 'local'
+    resource.features = {'queue': 'short,long', 'max_jobs_running': '1,2',
+                         'max_jobs_in_queue': '3,4', 'lrms': 'fork'}
+    resource.Communicator = CountingCommunicator()
+    info = resource.host_properties('local')
+    assert len(resource.Communicator.commands) == 1
+    assert 'QUEUE_STATUS[0]="short-limit/short-warning"' in info
+    assert 'QUEUE_STATUS[1]="long-limit/long-warning"' in info
+    assert 'OS_VERSION="NULL"' not in info
+
+
+def test_slurm_queue_metrics():
+    out = ('short* up 10/6/0/16\nlong up 4/0/0/4\n---\n'
+           'short RUNNING\nshort PENDING\nshort,long PENDING\nlong RUNNING\n')
+    metrics = drm4g.managers.slurm.Resource().queue_metrics_result(out, '')
+    assert metrics['default'] is metrics['short']
+    assert metrics['short'] == {'Nodes': '16', 'FreeNodes': '6', 'Status': 'up',
+                                'RunningJobs': 1, 'QueuedJobs': 2}
+    assert metrics['long']['RunningJobs'] == 1
+    assert metrics['long']['QueuedJobs'] == 1
+
+
+def test_exec_batch():
+    communicator = CountingCommunicator()
+    results = communicator.execBatch(['echo a; echo b >&2; exit 4', 'printf x', 'cat', 'cd / && pwd', 'pwd'])
+    assert len(communicator.commands) == 1
+    assert results[:4] == [('a\n', 'b\n', 4), ('x', '', 0), ('', '', 0), ('/\n', '', 0)]
+    assert results[4] == (os.getcwd() + '\n', '', 0)
+
+
+def test_fork_job_cancel():
+    proc = subprocess.Popen(['bash', '-c', 'sleep 30 & sleep 30 & wait'])
+    time.sleep(0.5)
+    try:
+        job = drm4g.managers.fork.Job()
+        job.Communicator = CountingCommunicator()
+        job.JobId = str(proc.pid)
+        children = subprocess.check_output(['ps', 'ho', 'pid', '--ppid', str(proc.pid)]).split()
+        job.jobCancel()
+        assert proc.wait(5) == -9
+        assert len(children) == 2
+        states = subprocess.run(['ps', 'ho', 'stat', '-p', b','.join(children)], stdout=subprocess.PIPE).stdout.split()
+        assert all(state.startswith(b'Z') for state in states)
+        # ps and kill of each level of the process tree
+        assert len(job.Communicator.commands) == 4
+    finally:
+        proc.kill()
@@ -0,0 +1,65 @@
+import pytest
+
+import drm4g.communicators.openssh
+from drm4g.communicators.openssh import Communicator
+
+
+class FakePopen(object):
+    """
+    `ssh -M -N -f` exiting straight away with returncode and stderr.
+    """
+    started = []
+
+    def __init__(self, returncode, err=b'', on_start=None):
+        self.result = (returncode, err, on_start)
+
+    def __call__(self, command, stdin=None, stdout=None, stderr=None, env=None):
+        returncode, err, on_start = self.result
+        stderr.write(err)
+        FakePopen.started.append(command)
+        if on_start:
+            on_start()
+        self.returncode = returncode
+        return self
+
+    def poll(self):
+        return self.returncode
+
+    def kill(self):
+        pass
+
+
+@pytest.fixture
+def communicator(tmp_path, monkeypatch):
+    monkeypatch.setattr(Communicator, 'socket_dir', str(tmp_path))
+    monkeypatch.setattr(Communicator, '_master_locks', dict())
+    monkeypatch.setattr(FakePopen, 'started', [])
+    # no agent is started
+    com = Communicator.__new__(Communicator)
+    com.parent_module, com.configfile, com.agent_socket = 'im', 'config', None
+    com.username, com.frontend, com.port, com.private_key = 'user', 'host', 22, 'id_rsa'
+    com.master_timeout = 1
+    return com
+
+
+def test_start_master(communicator, monkeypatch):
+    socket = communicator._socket_path()
+    monkeypatch.setattr(Communicator, '_master_alive', lambda self: True)
+    monkeypatch.setattr(drm4g.communicators.openssh.subprocess, 'Popen',
+                        FakePopen(0, on_start=lambda: open(socket, 'w').close()))
+    communicator._start_master()
+    assert len(FakePopen.started) == 1
+    # already running
+    communicator._start_master()
+    assert len(FakePopen.started) == 1
+
+
+def test_start_master_failure(communicator, monkeypatch):
+    monkeypatch.setattr(Communicator, '_master_alive', lambda self: False)
+    monkeypatch.setattr(drm4g.communicators.openssh.subprocess, 'Popen',
+                        FakePopen(255, b'ssh: Could not resolve hostname host\n'))
+    with pytest.raises(Exception) as excinfo:
+        communicator._start_master()
+    assert 'Could not resolve hostname host' in str(excinfo.value)
+    # it fails without waiting for the socket nor retrying
+    assert len(FakePopen.started) == 1
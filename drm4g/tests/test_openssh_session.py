@@ -0,0 +1,52 @@
+import threading
+
+from drm4g.communicators.openssh_session import ShellSession, SessionPool
+
+
+def test_shell_session_framing():
+    session = ShellSession(['/bin/bash'])
+    try:
+        assert session.run('echo out; echo err >&2; exit 3') == ('out', 'err', 3)
+        assert session.run('printf no-newline') == ('no-newline', '', 0)
+        assert session.run('cd /; false') == ('', '', 1)
+        assert session.run('pwd')[0] != '/'
+    finally:
+        session.close()
+    assert not session.is_alive()
+
+
+def test_session_pool_reuse():
+    opened = []
+
+    def new_session():
+        opened.append(ShellSession(['/bin/bash']))
+        return opened[-1]
+
+    pool = SessionPool(new_session, 2)
+    results = []
+
+    def run(i):
+        session = pool.lease()
+        try:
+            results.append(session.run('sleep 0.2; echo %d' % i)[0])
+        finally:
+            pool.release(session)
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    pool.close()
+    assert sorted(results) == ['0', '1', '2', '3']
+    assert len(opened) == 2
+
+
+def test_shell_session_batch():
+    session = ShellSession(['/bin/bash'])
+    try:
+        results = session.run_batch(['echo a; echo b >&2; exit 4', 'printf x', 'cat', 'cd / && pwd', 'seq 20000'])
+    finally:
+        session.close()
+    assert results[:4] == [('a\n', 'b\n', 4), ('x', '', 0), ('', '', 0), ('/\n', '', 0)]
+    assert results[4][0].splitlines()[-1] == '20000'
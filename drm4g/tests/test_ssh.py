@@ -0,0 +1,88 @@
+import pytest
+
+import drm4g.communicators.ssh
+from drm4g.communicators import ComException
+from drm4g.communicators.ssh import TransportPool
+
+
+class StubTransport(object):
+
+    def __init__(self):
+        self.active = True
+        self.closed = False
+
+    def is_active(self):
+        return self.active
+
+    def is_authenticated(self):
+        return True
+
+    def close(self):
+        self.closed = True
+
+
+def new_pool(opened, max_transports=2, max_sessions=2):
+
+    def new_transport():
+        opened.append(StubTransport())
+        return opened[-1]
+
+    return TransportPool(new_transport, max_transports, max_sessions)
+
+
+def test_transport_pool_lease_release(monkeypatch):
+    monkeypatch.setattr(drm4g.communicators.ssh, 'SSH_CONNECT_TIMEOUT', 0.1)
+    opened = []
+    pool = new_pool(opened)
+    leased = [pool.lease() for _ in range(4)]
+    # max_sessions channels on each of the max_transports transports
+    assert len(opened) == 2
+    assert leased.count(opened[0]) == leased.count(opened[1]) == 2
+    with pytest.raises(ComException):
+        pool.lease()
+    pool.release(opened[1])
+    assert pool.lease() is opened[1]
+    assert len(opened) == 2
+
+
+def test_transport_pool_broken_transport():
+    opened = []
+    pool = new_pool(opened)
+    transport = pool.lease()
+    pool.release(transport)
+    transport.active = False
+    assert pool.lease() is opened[1]
+    assert transport.closed
+
+
+def test_transport_pool_close_last_user():
+    opened = []
+    pool = new_pool(opened, max_sessions=1)
+    pool.add_user()
+    pool.add_user()
+    busy, idle = pool.lease(), pool.lease()
+    pool.release(idle)
+    pool.remove_user()
+    assert not busy.closed
+    pool.remove_user()
+    assert idle.closed
+    # the busy transport is closed once it is released
+    assert not busy.closed
+    pool.release(busy)
+    assert busy.closed
+
+
+def test_communicator_close_shared_pool(monkeypatch):
+    opened = []
+    monkeypatch.setattr(drm4g.communicators.ssh.Communicator, '_pools', dict())
+    monkeypatch.setattr(drm4g.communicators.ssh.Communicator, '_new_transport',
+                        lambda self: opened.append(StubTransport()) or opened[-1])
+    first, second = drm4g.communicators.ssh.Communicator(), drm4g.communicators.ssh.Communicator()
+    for com in (first, second):
+        com.username, com.frontend = 'user', 'host'
+        com.connect()
+    assert len(opened) == 1
+    first.close()
+    assert not opened[0].closed
+    second.close()
+    assert opened[0].closed
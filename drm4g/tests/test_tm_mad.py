@@ -0,0 +1,142 @@
+import threading
+
+from drm4g.core.tm_mad           import GwTmMad
+from drm4g.communicators.local import Communicator
+
+
+class FakeConfiguration(object):
+
+    def __init__(self):
+        self.resources = {'local': {'communicator': 'local'}}
+        self.updated = False
+        self.loads = 0
+        self.made = []
+
+    def check_update(self):
+        updated, self.updated = self.updated, False
+        return updated
+
+    def load(self):
+        self.loads += 1
+        self.resources = {'local': {'communicator': 'local', 'loads': self.loads}}
+
+    def check(self):
+        return []
+
+    def make_communicator(self, name):
+        self.made.append(name)
+        return Communicator()
+
+
+def test_update_com_cache():
+    gw_tm_mad = GwTmMad()
+    gw_tm_mad._configure = config = FakeConfiguration()
+    com = gw_tm_mad._update_com('local')
+    assert gw_tm_mad._update_com('local::host') is com
+    assert config.loads == 0
+    config.updated = True
+    assert gw_tm_mad._update_com('local') is not com
+    assert config.loads == 1
+    assert config.made == ['local', 'local']
+    try:
+        gw_tm_mad._update_com('other')
+    except Exception as err:
+        assert 'not configured' in str(err)
+    else:
+        assert False
+
+
+class BatchCommunicator(Communicator):
+
+    def __init__(self):
+        Communicator.__init__(self)
+        self.batches = []
+
+    def copyFiles(self, transfers):
+        self.batches.append(transfers)
+        return [None if 'ok' in source else 'No such file' for source, _, _ in transfers]
+
+
+def test_coalesce_cp(capsys):
+    import time
+    from drm4g.utils.dynamic import ThreadPool
+    gw_tm_mad = GwTmMad()
+    gw_tm_mad._pool = ThreadPool(1, 2)
+    gw_tm_mad._cp_window = 0.2
+    com = BatchCommunicator()
+    gw_tm_mad._update_com = lambda host: com
+    for tid, name in enumerate(['ok1', 'ok2', 'bad']):
+        gw_tm_mad._add_transfer('CP 7 %d - file:///tmp/%s gsiftp://res/~/7/%s' % (tid, name, name))
+    deadline = time.time() + 5
+    out = ''
+    while out.count('CP 7') < 3 and time.time() < deadline:
+        time.sleep(0.05)
+        out += capsys.readouterr().out
+    assert len(com.batches) == 1
+    assert len(com.batches[0]) == 3
+    assert 'CP 7 0 SUCCESS -' in out
+    assert 'CP 7 1 SUCCESS -' in out
+    assert 'CP 7 2 FAILURE No such file' in out
+
+
+def test_mkdir_rmdir_in_event_loop(tmp_path, capsys):
+    import os
+    from drm4g.utils.aio import get_event_loop
+    gw_tm_mad = GwTmMad()
+    com = Communicator()
+    com.work_directory = str(tmp_path)
+    gw_tm_mad._update_com = lambda host: com
+    loop = get_event_loop()
+    loop.run(gw_tm_mad.do_MKDIR('MKDIR 7 - - gsiftp://local/~/7 -'), 10)
+    assert os.path.isdir(str(tmp_path / '7'))
+    (tmp_path / '7' / '.lock').write_text('')
+    loop.run(gw_tm_mad.do_RMDIR('RMDIR 7 - - gsiftp://local/~/7 -'), 10)
+    assert os.path.isdir(str(tmp_path / '7'))
+    os.remove(str(tmp_path / '7' / '.lock'))
+    loop.run(gw_tm_mad.do_RMDIR('RMDIR 7 - - gsiftp://local/~/7 -'), 10)
+    assert not os.path.exists(str(tmp_path / '7'))
+    out = capsys.readouterr().out
+    assert 'MKDIR 7 - SUCCESS -' in out
+    assert 'RMDIR 7 - FAILURE Directory "gsiftp://local/~/7" is locked' in out
+    assert 'RMDIR 7 - SUCCESS -' in out
+
+
+class CopyCommunicator(BatchCommunicator):
+
+    def copy(self, source_url, destination_url, execution_mode):
+        self.batches.append([(source_url, destination_url, execution_mode)])
+
+
+def test_lone_cp_not_delayed(capsys):
+    import os
+    import time
+    gw_tm_mad = GwTmMad()
+    gw_tm_mad._cp_window = 30
+    com = CopyCommunicator()
+    gw_tm_mad._update_com = lambda host: com
+    read_fd, write_fd = os.pipe()
+    gw_tm_mad._stdin_fd = read_fd
+    worker = threading.Thread(target=gw_tm_mad.processLine)
+    worker.daemon = True
+    worker.start()
+
+    def wait_output(text):
+        out = ''
+        deadline = time.time() + 5
+        while text not in out and time.time() < deadline:
+            time.sleep(0.05)
+            out += capsys.readouterr().out
+        return out
+
+    try:
+        os.write(write_fd, b'CP 7 0 - file:///tmp/ok0 gsiftp://res/~/7/ok0\n')
+        assert 'CP 7 0 SUCCESS -' in wait_output('CP 7 0')
+        # requests written together are still copied together
+        os.write(write_fd, b'CP 8 0 - file:///tmp/ok0 gsiftp://res/~/8/ok0\n'
+                           b'CP 8 1 - file:///tmp/ok1 gsiftp://res/~/8/ok1\n')
+        assert 'CP 8 1 SUCCESS -' in wait_output('CP 8 1')
+    finally:
+        os.close(write_fd)
+        worker.join(5)
+        os.close(read_fd)
+    assert [len(batch) for batch in com.batches] == [1, 2]
@@ -0,0 +1,116 @@
+#
+# Copyright 2021 Santander Meteorology Group (UC-CSIC)
+#
+# Licensed under the EUPL, Version 1.1 only (the
+# "Licence");
+# You may not use this work except in compliance with the
+# Licence.
+# You may obtain a copy of the Licence at:
+#
+# http://ec.europa.eu/idabc/eupl
+#
+# Unless required by applicable law or agreed to in
+# writing, software distributed under the Licence is
+# distributed on an "AS IS" basis,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either
+# express or implied.
+# See the Licence for the specific language governing
+# permissions and limitations under the Licence.
+#
+
+import asyncio
+import threading
+
+"""
+Use example
+from drm4g.utils.aio import get_event_loop
+loop = get_event_loop()
+out, err = loop.run( communicator.execCommandAsync( 'qstat' ) )
+"""
+
+_event_loop      = None
+_event_loop_lock = threading.Lock()
+
+
+class EventLoop(object):
+    """
+    asyncio event loop running in a daemon thread.
+
+    Threads hand coroutines over to the loop, so any number of remote
+    commands can be waited for at once from a single thread.
+    """
+    def __init__(self):
+        self._loop   = asyncio.new_event_loop()
+        self._thread = threading.Thread( target = self._run )
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _run(self):
+        asyncio.set_event_loop( self._loop )
+        self._loop.run_forever()
+
+    def submit(self, coro):
+        """
+        Schedule coro in the loop.
+
+        @return: future with the result of the coroutine
+        @rtype: concurrent.futures.Future
+        """
+        return asyncio.run_coroutine_threadsafe( coro, self._loop )
+
+    def run(self, coro, timeout=None):
+        """
+        Run coro in the loop and wait for its result.
+        """
+        return self.submit( coro ).result( timeout )
+
+    def close(self):
+        self._loop.call_soon_threadsafe( self._loop.stop )
+        self._thread.join()
+        self._loop.close()
+
+
+def get_event_loop():
+    """
+    Return the event loop shared by the process, starting it if needed.
+    """
+    global _event_loop
+    with _event_loop_lock :
+        if _event_loop is None :
+            _event_loop = EventLoop()
+        return _event_loop
+
+
+async def run_process(command, input=None, timeout=None, env=None, shell=False):
+    """
+    Run a process without blocking the event loop.
+
+    @param command: argument list of the process, or a shell command if shell is True
+    @type command: list or string
+    @param input: data sent to the standard input of the process
+    @type input: bytes
+    @param timeout: seconds to wait for the process, it is killed afterwards
+    @type timeout: int
+    @return: stdout, stderr and exit code of the process
+    @rtype: tuple (bytes, bytes, int)
+    @raise asyncio.TimeoutError: if the process did not finish on time
+    """
+    if shell :
+        proc = await asyncio.create_subprocess_shell( command,
+                                                      stdin  = asyncio.subprocess.PIPE,
+                                                      stdout = asyncio.subprocess.PIPE,
+                                                      stderr = asyncio.subprocess.PIPE,
+                                                      env    = env )
+    else :
+        proc = await asyncio.create_subprocess_exec( *command,
+                                                     stdin  = asyncio.subprocess.PIPE,
+                                                     stdout = asyncio.subprocess.PIPE,
+                                                     stderr = asyncio.subprocess.PIPE,
+                                                     env    = env )
+    try :
+        out, err = await asyncio.wait_for( proc.communicate( input ), timeout )
+    except asyncio.TimeoutError :
+        proc.kill()
+        await proc.wait()
+        raise
+    return out, err, proc.returncode
@@ -0,0 +1,70 @@
+#
+# Copyright 2021 Santander Meteorology Group (UC-CSIC)
+#
+# Licensed under the EUPL, Version 1.1 only (the
+# "Licence");
+# You may not use this work except in compliance with the
+# Licence.
+# You may obtain a copy of the Licence at:
+#
+# http://ec.europa.eu/idabc/eupl
+#
+# Unless required by applicable law or agreed to in
+# writing, software distributed under the Licence is
+# distributed on an "AS IS" basis,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either
+# express or implied.
+# See the Licence for the specific language governing
+# permissions and limitations under the Licence.
+#
+
+
+import json
+import time
+import sqlite3
+import threading
+
+
+class HostCache (object):
+    """
+    Persistent cache of the information gathered from the hosts by the
+    IM MAD.
+
+    Every entry expires after its own time to live, so static facts (OS,
+    architecture) and dynamic ones (queue limits) can be refreshed at
+    different rates. Entries are kept on disk to survive MAD restarts.
+    """
+    def __init__(self, filename):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect( filename, check_same_thread = False )
+        with self._lock :
+            self._conn.execute( 'PRAGMA journal_mode=WAL' )
+            self._conn.execute( 'CREATE TABLE IF NOT EXISTS hosts ('
+                                'key TEXT PRIMARY KEY, value TEXT, expiration REAL)' )
+            self._conn.execute( 'DELETE FROM hosts WHERE expiration < ?', ( time.time(), ) )
+            self._conn.commit()
+
+    def get(self, key):
+        """
+        @return: the value stored for key or None if it has expired
+        """
+        with self._lock :
+            row = self._conn.execute( 'SELECT value, expiration FROM hosts WHERE key = ?', ( key, ) ).fetchone()
+        if row and row[ 1 ] > time.time() :
+            return json.loads( row[ 0 ] )
+        return None
+
+    def put(self, key, value, ttl):
+        with self._lock :
+            self._conn.execute( 'INSERT OR REPLACE INTO hosts VALUES (?, ?, ?)',
+                                ( key, json.dumps( value ), time.time() + ttl ) )
+            self._conn.commit()
+
+    def delete(self, key):
+        with self._lock :
+            self._conn.execute( 'DELETE FROM hosts WHERE key = ?', ( key, ) )
+            self._conn.commit()
+
+    def close(self):
+        with self._lock :
+            self._conn.close()
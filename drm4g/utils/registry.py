@@ -0,0 +1,72 @@
+#
+# Copyright 2021 Santander Meteorology Group (UC-CSIC)
+#
+# Licensed under the EUPL, Version 1.1 only (the
+# "Licence");
+# You may not use this work except in compliance with the
+# Licence.
+# You may obtain a copy of the Licence at:
+#
+# http://ec.europa.eu/idabc/eupl
+#
+# Unless required by applicable law or agreed to in
+# writing, software distributed under the Licence is
+# distributed on an "AS IS" basis,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either
+# express or implied.
+# See the Licence for the specific language governing
+# permissions and limitations under the Licence.
+#
+
+import time
+import sqlite3
+import threading
+
+
+class JobRegistry (object):
+    """
+    Persistent record of the jobs handled by the EM MAD.
+
+    Every job is stored with the host it was submitted to, its LRMS
+    job identifier, its last known status and timestamps, so the MAD
+    can rebuild its list of jobs after a restart.
+    """
+    def __init__(self, filename):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect( filename, check_same_thread = False )
+        with self._lock :
+            self._conn.execute( 'PRAGMA journal_mode=WAL' )
+            self._conn.execute( 'PRAGMA synchronous=NORMAL' )
+            self._conn.execute( 'CREATE TABLE IF NOT EXISTS jobs ('
+                                'jid TEXT PRIMARY KEY, host TEXT, job_id TEXT, status TEXT, '
+                                'submit_time REAL, update_time REAL)' )
+            self._conn.commit()
+
+    def put(self, jid, host, job_id, status=None):
+        now = time.time()
+        with self._lock :
+            self._conn.execute( 'INSERT OR REPLACE INTO jobs VALUES (?, ?, ?, ?, ?, ?)',
+                                ( jid, host, job_id, status, now, now ) )
+            self._conn.commit()
+
+    def update(self, jid, status):
+        with self._lock :
+            self._conn.execute( 'UPDATE jobs SET status = ?, update_time = ? WHERE jid = ?',
+                                ( status, time.time(), jid ) )
+            self._conn.commit()
+
+    def delete(self, jid):
+        with self._lock :
+            self._conn.execute( 'DELETE FROM jobs WHERE jid = ?', ( jid, ) )
+            self._conn.commit()
+
+    def items(self):
+        """
+        @return: list of (jid, host, job_id, status) tuples
+        """
+        with self._lock :
+            return self._conn.execute( 'SELECT jid, host, job_id, status FROM jobs' ).fetchall()
+
+    def close(self):
+        with self._lock :
+            self._conn.close()